@@ -0,0 +1,5 @@
+'''Makes the repository importable as the package 'utils.misc' when the benchmarks run from a checkout 
+   of the repository alone (see tests/conftest.py).'''
+import os, runpy
+
+runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'conftest.py'))
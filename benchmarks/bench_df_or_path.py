@@ -0,0 +1,74 @@
+'''
+Benchmark of the typed loading of misc_pandas.df_or_path (infer_types=True) against the loading of all the 
+columns as object followed by the conversion of the numeric and datetime columns (to_numeric_col and 
+pd.to_datetime). Each mode runs in its own process so that the peak resident memory is reported per mode.
+
+Usage: python benchmarks/bench_df_or_path.py [n_rows] [n_repeat]
+'''
+import os, sys, time, tempfile, resource, subprocess
+import numpy  as np
+import pandas as pd
+
+import _bootstrap
+from utils.misc import misc_pandas as mpd
+
+NUM_COLS = ['power', 'irradiance', 'temperature', 'wind']
+DATE_FMT = '%Y-%m-%d %H:%M:%S'
+
+
+def make_csv (fpath, n_rows):
+    '''Writes a semicolon separated CSV file with a datetime, a categorical, an integer and float columns.'''
+    rng = np.random.default_rng(0)
+    df  = pd.DataFrame({'date'      : pd.date_range('2020-01-01', periods=n_rows, freq='min').strftime(DATE_FMT),
+                        'asset'     : rng.choice(['INV-%02d' % i for i in range(20)], n_rows),
+                        'status'    : rng.integers(0, 5, n_rows)})
+    for col in NUM_COLS:
+        df[col] = rng.normal(500, 200, n_rows).round(3)
+    df.to_csv(fpath, sep=';', index=False)
+
+
+def load_object (fpath):
+    '''Loads every column as object and converts the numeric and datetime columns afterwards.'''
+    _, df = mpd.df_or_path({'df': fpath}, col_as_object=True)
+    for col in NUM_COLS + ['status']:
+        df[col] = mpd.to_numeric_col(df[col])
+    df['date'] = pd.to_datetime(df['date'], format=DATE_FMT)
+    return df
+
+
+def load_typed (fpath):
+    '''Parses the file directly into the inferred types.'''
+    _, df = mpd.df_or_path({'df': fpath}, infer_types=True, date_fmt=DATE_FMT)
+    return df
+
+
+MODES = {'object': load_object, 'typed': load_typed}
+
+
+def run_mode (mode, fpath, n_repeat):
+    '''Runs one mode in the current process and prints the best time, the frame size and the peak RSS.'''
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        df = MODES[mode](fpath)
+        lst_t.append(time.perf_counter() - t0)
+    mem_df  = df.memory_usage(deep=True).sum() / 2**20
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10   # KiB on Linux
+    print('%-7s: best %.3f s, frame %.1f MB, peak RSS %.1f MB' % (mode, min(lst_t), mem_df, max_rss))
+
+
+def main (n_rows=500_000, n_repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = os.path.join(tmp, 'data.csv')
+        make_csv(fpath, n_rows)
+        print('%d rows, %.1f MB on disk' % (n_rows, os.path.getsize(fpath) / 2**20))
+        for mode in MODES:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, fpath, str(n_repeat)],
+                           check=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--mode']:
+        run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(*[int(v) for v in sys.argv[1:]])
@@ -0,0 +1,44 @@
+'''
+Benchmark of misc.dms2deg_col, which converts a whole column of DMS coordinates at once, against calling 
+misc.dms2deg value by value, with and without unit symbols.
+
+Usage: python benchmarks/bench_dms2deg.py [n_values] [n_repeat]
+'''
+import sys, time, random
+import numpy as np
+
+import _bootstrap
+from utils.misc import misc
+
+
+def random_dms (n, units, seed=0):
+    '''Random coordinates such as 40°26'46.3"N (units) or 402646.3N.'''
+    rnd = random.Random(seed)
+    if units:
+        return ['%d°%02d\'%04.1f"%s' % (rnd.randint(0, 179), rnd.randint(0, 59), rnd.uniform(0, 59.9), rnd.choice('NSEW'))
+                for _ in range(n)]
+    return ['%02d%02d%04.1f%s' % (rnd.randint(0, 89), rnd.randint(0, 59), rnd.uniform(0, 59.9), rnd.choice('NSEW'))
+            for _ in range(n)]
+
+
+def best_time (func, n_repeat):
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        func()
+        lst_t.append(time.perf_counter() - t0)
+    return min(lst_t)
+
+
+def main (n_values=100_000, n_repeat=5):
+    print('%d values' % n_values)
+    for units in (True, False):
+        vals = random_dms(n_values, units, seed=1)
+        np.testing.assert_allclose(misc.dms2deg_col(vals, units=units), [misc.dms2deg(v, units=units) for v in vals])
+        t_loop = best_time(lambda: [misc.dms2deg(v, units=units) for v in vals], n_repeat)
+        t_col  = best_time(lambda: misc.dms2deg_col(vals, units=units), n_repeat)
+        print('units=%-5s: dms2deg loop %.3f s, dms2deg_col %.3f s (x%.1f)' % (units, t_loop, t_col, t_loop / t_col))
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
@@ -0,0 +1,59 @@
+'''
+Per call cost of the cached frequency alias helpers (misc_pandas.parse_freq, misc_pandas.get_sec_of_freq 
+and misc.fix_freq) against their previous implementations, which compiled their regular expressions and 
+built a pd.Timedelta on every call (copied below).
+
+Usage: python benchmarks/bench_freq.py [n_calls]
+'''
+import re, sys, timeit
+import pandas as pd
+
+import _bootstrap
+from utils.misc import misc_pandas as mpd
+from utils.misc import misc        as misc
+
+FREQS = ['15min', 'h', '30s', 'D', '10min', 'M']
+
+
+def get_sec_of_freq_legacy (freq):
+    '''The previous implementation of misc_pandas.get_sec_of_freq.'''
+    r      = re.compile("([0-9]+)([a-zA-Z]+)")
+    re_frq = r.match(freq)
+    if freq[-1] == 'M':
+        if re_frq is not None: secs = int(re_frq.group(1))*31.0*24.0*3600.0
+        else:                  secs = 31.0*24.0*3600.0
+    else:
+        if re_frq is not None: secs = pd.to_timedelta(int(re_frq.group(1)), unit=re_frq.group(2)).total_seconds()
+        else:                  secs = pd.to_timedelta(                   1, unit=freq           ).total_seconds()
+    return secs
+
+
+def fix_freq_legacy (freq):
+    '''The previous implementation of misc.fix_freq.'''
+    cmd = re.compile(r'^(\d+)')
+    if(not cmd.findall(freq)):
+        return '1'+freq
+    return freq
+
+
+def per_call_us (func, n_calls):
+    '''Returns the best per call time in microseconds over the aliases of FREQS.'''
+    t = min(timeit.repeat(lambda: [func(f) for f in FREQS], number=n_calls, repeat=3))
+    return t / (n_calls * len(FREQS)) * 1e6
+
+
+def main (n_calls=2000):
+    for f in FREQS:
+        assert mpd.get_sec_of_freq(f) == get_sec_of_freq_legacy(f), f
+        assert misc.fix_freq(f)       == fix_freq_legacy(f), f
+    lst = [('get_sec_of_freq (legacy)', get_sec_of_freq_legacy),
+           ('get_sec_of_freq'         , mpd.get_sec_of_freq),
+           ('parse_freq'              , mpd.parse_freq),
+           ('fix_freq (legacy)'       , fix_freq_legacy),
+           ('fix_freq'                , misc.fix_freq)]
+    for name, func in lst:
+        print('%-25s: %8.3f us per call' % (name, per_call_us(func, n_calls)))
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
@@ -0,0 +1,48 @@
+'''
+Benchmark of misc_math.lines_intersect, which intersects arrays of pairs of lines at once, against calling 
+misc_math.line_intersect pair by pair.
+
+Usage: python benchmarks/bench_lines_intersect.py [n_pairs] [n_repeat]
+'''
+import sys, time
+import numpy as np
+
+import _bootstrap
+from utils.misc import misc_math as mmt
+
+
+def best_time (func, n_repeat):
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        func()
+        lst_t.append(time.perf_counter() - t0)
+    return min(lst_t)
+
+
+def loop (m1, b1, m2, b2):
+    '''Per call loop, with NaN for the parallel lines.'''
+    x = np.empty(len(m1))
+    y = np.empty(len(m1))
+    for i in range(len(m1)):
+        pt = mmt.line_intersect(m1[i], b1[i], m2[i], b2[i])
+        x[i], y[i] = (np.nan, np.nan) if pt is None else pt
+    return x, y
+
+
+def main (n_pairs=1_000_000, n_repeat=3):
+    rng            = np.random.default_rng(0)
+    m1, b1, m2, b2 = rng.normal(size=(4, n_pairs))
+    m2[::100]      = m1[::100]  # 1% of parallel lines
+    # The loop is timed over the plain Python floats, as in the callers iterating over the segments
+    lst_args = [v.tolist() for v in (m1, b1, m2, b2)]
+    np.testing.assert_allclose(loop(*lst_args), mmt.lines_intersect(m1, b1, m2, b2))
+    t_loop = best_time(lambda: loop(*lst_args), n_repeat)
+    t_vect = best_time(lambda: mmt.lines_intersect(m1, b1, m2, b2), n_repeat)
+    print('%d pairs of lines' % n_pairs)
+    print('line_intersect (loop): best %.3f s' % t_loop)
+    print('lines_intersect      : best %.3f s (x%.0f)' % (t_vect, t_loop / t_vect))
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
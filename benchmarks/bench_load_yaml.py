@@ -0,0 +1,60 @@
+'''
+Benchmark of misc_yaml.load_yaml: the pure Python loader against the libyaml ones (if available), the 
+in-process cache (cache=True) and the binary snapshots used at worker startup (snapshot_dir).
+
+Usage: python benchmarks/bench_load_yaml.py [n_assets] [n_repeat]
+'''
+import os, sys, time, tempfile
+import yaml
+
+import _bootstrap
+from utils.misc import misc_yaml as myml
+
+
+def make_conf (fpath, n_assets):
+    '''Writes a configuration file with a list of assets, each one with nested settings.'''
+    conf = {'title': 'plant', 'assets': [{'name': 'INV-%04d' % i, 'p_nom': 100.0 + i, 'enabled': i % 7 != 0, 
+                                          'strings': [{'id': j, 'modules': 28, 'tilt': 25.0} for j in range(8)],
+                                          'tags': ['inverter', 'zone-%d' % (i % 10)]} for i in range(n_assets)]}
+    myml.dump_yaml(conf, fpath)
+
+
+def best_time (func, n_repeat):
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        func()
+        lst_t.append(time.perf_counter() - t0)
+    return min(lst_t)
+
+
+def main (n_assets=500, n_repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath    = os.path.join(tmp, 'conf.yaml')
+        snap_dir = os.path.join(tmp, 'snap')
+        make_conf(fpath, n_assets)
+        print('%d assets, %.1f kB, libyaml %s' % (n_assets, os.path.getsize(fpath) / 1024,
+                                                  'available' if hasattr(yaml, 'CLoader') else 'not available'))
+        myml.load_yaml(fpath, cache=True)
+        myml.load_yaml(fpath, snapshot_dir=snap_dir)
+
+        def snapshot ():
+            # As a new worker: empty in-process cache, but the snapshot of a previous process
+            myml.clear_yaml_cache()
+            return myml.load_yaml(fpath, snapshot_dir=snap_dir)
+
+        lst = [('yaml.Loader (pure Python)', lambda: myml.load_yaml(fpath, loader=yaml.Loader)),
+               ('FULL_LOADER'              , lambda: myml.load_yaml(fpath)),
+               ('SAFE_LOADER'              , lambda: myml.load_yaml(fpath, loader=myml.SAFE_LOADER)),
+               ('snapshot_dir'             , snapshot),
+               ('cache=True'               , lambda: myml.load_yaml(fpath, cache=True))]
+        t_ref = None
+        for name, func in lst:
+            t     = best_time(func, n_repeat)
+            t_ref = t if t_ref is None else t_ref
+            print('%-26s: best %8.2f ms (x%.0f)' % (name, t * 1e3, t_ref / t))
+        myml.clear_yaml_cache()
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
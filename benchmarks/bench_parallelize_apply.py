@@ -0,0 +1,43 @@
+'''
+Benchmark of the backends of misc_mproc.parallelize_apply: shared memory ('shm') against the process 
+pool ('process') and Ray ('ray', skipped if Ray is not installed).
+
+Usage: python benchmarks/bench_parallelize_apply.py [n_rows] [n_cols] [nproc]
+'''
+import sys, time
+import numpy  as np
+import pandas as pd
+
+import _bootstrap
+from utils.misc import misc_mproc as mmp
+
+
+def row_stats (df):
+    '''Cheap per-row work, so the cost of moving the data dominates.'''
+    return pd.DataFrame({'mean': df.mean(axis=1), 'max': df.max(axis=1)})
+
+
+def main (n_rows=2_000_000, n_cols=20, nproc=None):
+    nproc = nproc or mmp.config['nproc']
+    df    = pd.DataFrame(np.random.rand(n_rows, n_cols), columns=[f'c{i}' for i in range(n_cols)])
+    print(f'{n_rows} x {n_cols} float64 ({df.memory_usage().sum()/1e6:.0f} MB), {nproc} processes')
+    ref   = row_stats(df)
+    for backend in ['shm', 'process', 'ray']:
+        if backend == 'ray':
+            try:
+                import ray
+                ray.init(num_cpus=nproc, ignore_reinit_error=True, include_dashboard=False)
+            except ImportError:
+                print(f'{backend:8s}: skipped (Ray is not installed)')
+                continue
+        lst_t = []
+        for _ in range(3):
+            t_ini = time.perf_counter()
+            res   = mmp.parallelize_apply(df, row_stats, nproc=nproc, backend=backend)
+            lst_t.append(time.perf_counter() - t_ini)
+        assert np.allclose(res.to_numpy(), ref.to_numpy())
+        print(f'{backend:8s}: best {min(lst_t):.3f} s, mean {np.mean(lst_t):.3f} s')
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
@@ -0,0 +1,40 @@
+'''
+Benchmark of misc_math.smooth_nd, which smooths all the columns of a frame at once, against calling 
+misc_math.smooth column by column, for the flat window (cumulative sums or direct convolution), a short 
+window (direct convolution) and a long one (FFT).
+
+Usage: python benchmarks/bench_smooth_nd.py [n_rows] [n_cols] [n_repeat]
+'''
+import sys, time
+import numpy as np
+
+import _bootstrap
+from utils.misc import misc_math as mmt
+
+CASES = [('flat', 5), ('flat', 61), ('hanning', 11), ('hanning', 301)]
+
+
+def best_time (func, n_repeat):
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        func()
+        lst_t.append(time.perf_counter() - t0)
+    return min(lst_t)
+
+
+def main (n_rows=100_000, n_cols=20, n_repeat=3):
+    arr = np.cumsum(np.random.default_rng(0).normal(size=(n_rows, n_cols)), axis=0)
+    print('%d rows x %d columns' % (n_rows, n_cols))
+    for window, window_len in CASES:
+        loop = lambda: np.column_stack([mmt.smooth(arr[:, j], window_len, window) for j in range(n_cols)])
+        vect = lambda: mmt.smooth_nd(arr, window_len, window)
+        np.testing.assert_allclose(loop(), vect(), rtol=1e-9, atol=1e-9)
+        t_loop = best_time(loop, n_repeat)
+        t_vect = best_time(vect, n_repeat)
+        print('%-8s %4d: smooth per column %.3f s, smooth_nd %.3f s (x%.1f)' % (window, window_len, t_loop, t_vect,
+                                                                              t_loop / t_vect))
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
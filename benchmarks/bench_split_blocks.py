@@ -0,0 +1,49 @@
+'''
+Benchmark of the splitting of misc_mproc.parallelize_apply on a skewed workload: one block per process, 
+more blocks than processes (n_blocks=4*nproc), and blocks of similar cost (weights). The cost of each row 
+is simulated by sleeping, so the load balance shows even with fewer cores than processes.
+
+Usage: python benchmarks/bench_split_blocks.py [n_rows] [nproc] [backend]
+'''
+import sys, time
+import numpy  as np
+import pandas as pd
+
+import _bootstrap
+from utils.misc import misc_mproc as mmp
+
+SEC_PER_COST = 2e-4
+
+
+def costly_rows (df):
+    '''Sleeps the total cost of the rows of the block and returns their sum.'''
+    time.sleep(df['cost'].sum() * SEC_PER_COST)
+    return df[['cost']].sum().to_frame().T
+
+
+def make_frame (n_rows):
+    '''The first 5% of the rows are 50 times more costly than the rest.'''
+    cost = np.ones(n_rows)
+    cost[:n_rows // 20] = 50
+    return pd.DataFrame({'cost': cost})
+
+
+def main (n_rows=20_000, nproc=4, backend='process'):
+    nproc = int(nproc)
+    df    = make_frame(int(n_rows))
+    t_min = df['cost'].sum() * SEC_PER_COST / nproc
+    print('%d rows, %d processes (%s), ideal %.2f s' % (len(df), nproc, backend, t_min))
+    lst = [('one block per process', {}),
+           ('n_blocks=4*nproc'     , {'n_blocks': 4*nproc}),
+           ('weights'              , {'weights': 'cost'}),
+           ('weights, 4*nproc'     , {'weights': 'cost', 'n_blocks': 4*nproc})]
+    for name, opts in lst:
+        t0  = time.perf_counter()
+        res = mmp.parallelize_apply(df, costly_rows, nproc=nproc, backend=backend, **opts)
+        t   = time.perf_counter() - t0
+        assert res['cost'].sum() == df['cost'].sum()
+        print('%-22s: %.2f s (x%.2f of ideal)' % (name, t, t / t_min))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,65 @@
+'''
+Benchmark of misc_pandas.to_numeric_cols, which converts all the columns of a frame at once, against the 
+previous column by column converter (to_numeric_col as it was before to_numeric_cols, copied below).
+
+Usage: python benchmarks/bench_to_numeric_cols.py [n_rows] [n_cols] [n_repeat]
+'''
+import sys, time
+import numpy  as np
+import pandas as pd
+
+import _bootstrap
+from utils.misc import misc_pandas as mpd
+
+
+def to_numeric_col_legacy (col, comma_as_thousand=True, fillna=None):
+    '''The previous implementation of misc_pandas.to_numeric_col.'''
+    col_str   = col.astype(str)
+    has_comma = False if col_str.str.contains(',').sum() == 0 else True
+    has_dot   = False if col_str.str.contains('.').sum() == 0 else True
+    if has_comma and has_dot:
+        if comma_as_thousand: 
+            col_str = col_str.str.replace(',','')
+        else:                 
+            col_str = col_str.str.replace('.','')
+            col_str = col_str.str.replace(',','.')
+    elif has_comma:
+        col_str = col_str.str.replace(',','.')
+    col = pd.to_numeric(col_str, errors='coerce').astype(float)
+    if fillna is not None:
+        col = col.fillna(fillna)
+    return col
+
+
+def make_frame (n_rows, n_cols):
+    '''Builds an object frame mixing dot decimals, comma decimals and thousands separators.'''
+    rng  = np.random.default_rng(0)
+    data = {}
+    for i in range(n_cols):
+        vals = rng.normal(5000, 2000, n_rows).round(2)
+        if   i % 3 == 0: data['c%d' % i] = ['%.2f' % v for v in vals]
+        elif i % 3 == 1: data['c%d' % i] = [('%.2f' % v).replace('.', ',') for v in vals]
+        else:            data['c%d' % i] = ['{:,.2f}'.format(v) for v in vals]
+    return pd.DataFrame(data, dtype=object)
+
+
+def best_time (func, n_repeat):
+    lst_t = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        func()
+        lst_t.append(time.perf_counter() - t0)
+    return min(lst_t)
+
+
+def main (n_rows=100_000, n_cols=12, n_repeat=3):
+    df = make_frame(n_rows, n_cols)
+    print('%d rows x %d object columns' % (n_rows, n_cols))
+    t_old = best_time(lambda: pd.DataFrame({c: to_numeric_col_legacy(df[c]) for c in df.columns}), n_repeat)
+    t_new = best_time(lambda: mpd.to_numeric_cols(df), n_repeat)
+    print('to_numeric_col (legacy, per column): best %.3f s' % t_old)
+    print('to_numeric_cols                    : best %.3f s (x%.1f)' % (t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
@@ -7,8 +7,9 @@
 ## Date  : 22.10.2018
 ##
 
-import os, re, math, datetime, copy
+import os, re, math, datetime, copy, functools, heapq, pickle, warnings
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 logger = logging.getLogger() 
 
 #########################################################################################
@@ -149,17 +150,97 @@ def gp(val):
     return 's' if val > 1 else ''
 
 
+_re_freq_num = re.compile(r'^(\d+)')
+
+@functools.lru_cache(maxsize=256)
 def fix_freq (freq):
     ''' Fix the frequency alias that dont have a number to it.
         It will add the number 1 to the frequency, thus completing alias.
         Some functions of pandas need the unit and number.
     '''
-    cmd = re.compile('^(\d+)')
-    if(not cmd.findall(freq)):
+    if(not _re_freq_num.match(freq)):
         return '1'+freq
     return freq
 
 
+_REGEX_META = set('.^$*+?{}[]\\|()')
+_re_backref = re.compile(r'\\[1-9]|\(\?P=')
+
+class PatternMatcher:
+    '''
+    Matches strings against a list of regex patterns (search semantics, as has_pattern).
+    The patterns anchored literal prefixes ('^abc') are checked with str.startswith, and the rest are 
+    combined into one compiled alternation (or compiled one by one if they cannot be combined, ex. they 
+    have backreferences). Use get_matcher to reuse the compilations across calls.
+
+    Parameters
+    ----------
+    lst_regex : list
+        List of regex commands.
+    '''
+    def __init__(self, lst_regex):
+        self.lst_regex = list(lst_regex)
+        self.prefixes  = tuple(p[1:] for p in self.lst_regex if self._is_prefix(p))
+        self.lst_re    = [re.compile(p) for p in self.lst_regex if not self._is_prefix(p)]
+        self.re_all    = None
+        # Backreferences would point to the groups of other patterns once combined
+        if len(self.lst_re) > 1 and not any(_re_backref.search(r.pattern) for r in self.lst_re):
+            try:    self.re_all = re.compile('|'.join(f'(?:{r.pattern})' for r in self.lst_re))
+            except re.error: pass
+        elif len(self.lst_re) == 1:
+            self.re_all = self.lst_re[0]
+        self._lst_re_pos = [(re.compile(p), i) for i, p in enumerate(self.lst_regex)]
+
+    @staticmethod
+    def _is_prefix(patt):
+        return patt.startswith('^') and not _REGEX_META.intersection(patt[1:])
+
+    def is_match(self, val):
+        '''Returns whether the string matches at least one pattern. Non string values do not match.'''
+        if not isinstance(val, str): return False
+        if self.prefixes and val.startswith(self.prefixes): return True
+        if self.re_all is not None: return self.re_all.search(val) is not None
+        return any(r.search(val) is not None for r in self.lst_re)
+
+    def mask(self, items):
+        '''Returns which items match: a list of booleans, or a boolean array for pandas Index/Series of 
+           strings, which are matched with their vectorized string methods.'''
+        acc = getattr(items, 'str', None) if hasattr(items, 'dtype') else None
+        if acc is None: return [self.is_match(v) for v in items]
+        import numpy as np
+        res = np.zeros(len(items), dtype=bool)
+        if self.prefixes:
+            res |= np.asarray(acc.startswith(self.prefixes, na=False), dtype=bool)
+        with warnings.catch_warnings():
+            # pandas warns about the groups of the patterns, which are only used to match
+            warnings.filterwarnings('ignore', 'This pattern is interpreted as a regular expression')
+            for r in ([self.re_all] if self.re_all is not None else self.lst_re):
+                res |= np.asarray(acc.contains(r, na=False), dtype=bool)
+        return res
+
+    def select(self, items):
+        '''Returns the matching items: a list, or the same type for pandas Index/Series (boolean indexing).'''
+        mask = self.mask(items)
+        if hasattr(items, 'dtype'): return items[mask]
+        return [v for v, m in zip(items, mask) if m]
+
+    def which(self, items):
+        '''Returns, for each item, the first pattern (in the list order) that it matches, or None.'''
+        res = []
+        for v, m in zip(items, self.mask(items)):
+            res.append(next((self.lst_regex[i] for r, i in self._lst_re_pos if r.search(v)), None) if m else None)
+        return res
+
+
+@functools.lru_cache(maxsize=128)
+def _get_matcher(tpl_regex):
+    return PatternMatcher(tpl_regex)
+
+def get_matcher(lst_regex):
+    '''Returns the PatternMatcher of the patterns provided, cached across calls.'''
+    return _get_matcher(tuple(lst_regex))
+
+
 def has_pattern (lst, lst_regex):
     '''
     Selects the items in 'lst' matching at least one pattern in 'lst_patt'.
@@ -179,27 +260,20 @@ def has_pattern (lst, lst_regex):
     # Validating the arguments...........................................................
     assert isinstance(lst_regex, list), 'List expected and '+ type(lst_regex) + ' provided.'
     
-    # Compiling the regex commands.......................................................
-    lst_regex_comp = []
-    for re_cmd in lst_regex:
-        lst_regex_comp.append(re.compile(re_cmd))
-    
-    # Looking for matches................................................................
+    # Looking for matches (the patterns are compiled once per list of patterns)..........
+    matcher   = get_matcher(lst_regex)
     lst_match = []
     for v in lst:
         if isinstance(v, str):
-            for re_comp in lst_regex_comp:
-                res = re_comp.findall(v)
-                if res and len(res) > 0:
-                    lst_match.append(v)
-                    break
+            if matcher.is_match(v): lst_match.append(v)
         else:
             logger.debug(f'Column label passed as integer. Ignoring it: {v}')
     return lst_match            
 
 
-def set_blocks(lst, n_blocks):
+def set_blocks(lst, n_blocks, weights=None):
     """Returns list storing successive n-sized chunks from lst.
+       If weights are provided, the blocks are balanced by the total cost of their items instead.
     
         Parameters
         ----------
@@ -207,12 +281,31 @@ def set_blocks(lst, n_blocks):
             The list to be splitted.
         n_blocks : int
             The number of blocks to divide the list into.
+        weights : str, callable or list, optional
+            The cost of each item: 'size' for the size of the files in lst, a function applied to each item, 
+            or a list with one cost per item. The items are assigned greedily from the most expensive one to 
+            the block with the lowest total cost (longest processing time), keeping their order in each block.
 
         Return
         ------
             Returns a list with the blocks.
     """
+    # The count blocks are contiguous, so they keep being slices of lst (ex. arrays stay arrays)
+    return [lst[idx.start : idx.stop] if isinstance(idx, range) else [lst[i] for i in idx] 
+            for idx in _block_indices(lst, n_blocks, weights)]
+
+
+def iter_blocks(lst, n_blocks, weights=None):
+    """Lazy form of set_blocks: yields each block as a generator of the items of lst, without copying them 
+       into sublists. See set_blocks for the parameters."""
+    for idx in _block_indices(lst, n_blocks, weights):
+        yield (lst[i] for i in idx)
+
+
+def _block_indices(lst, n_blocks, weights=None):
+    """Returns the indices (ranges or lists) of the items of lst in each block."""
     assert n_blocks != 0, 'Number of items per block must be larger than ZERO.'
+    if weights is not None: return _weighted_block_indices(lst, n_blocks, weights)
     lst_n     = [ int(len(lst)/n_blocks) ] * n_blocks
     curr_sum  = sum(lst_n)
     n_missing = len(lst) - curr_sum 
@@ -226,12 +319,28 @@ def set_blocks(lst, n_blocks):
     i_init    = 0
     for nitem in lst_n:    
         i_last = i_init + nitem
-        lst_block.append(lst[i_init : i_last])
+        lst_block.append(range(i_init, i_last))
         i_init = i_last
 
     return lst_block
 
 
+def _weighted_block_indices(lst, n_blocks, weights):
+    """Distributes the items in n_blocks by their costs (greedy longest processing time)."""
+    if isinstance(weights, str) and weights == 'size': costs = [os.path.getsize(fnm) for fnm in lst]
+    elif callable(weights):                            costs = [weights(v) for v in lst]
+    else:                                              costs = list(weights)
+    assert len(costs) == len(lst), 'One weight per item expected.'
+    # Heap of (total cost, block), so the cheapest block receives the next most expensive item
+    heap  = [(0, i) for i in range(n_blocks)]
+    block = [[] for _ in range(n_blocks)]
+    for i in sorted(range(len(lst)), key=lambda i: costs[i], reverse=True):
+        load, ib = heapq.heappop(heap)
+        block[ib].append(i)
+        heapq.heappush(heap, (load + costs[i], ib))
+    return [sorted(idx) for idx in block if idx]
+
+
 def group_by_extension (lst_fnm, no_case):
     '''
     Groups the files in the list provided by their extension.
@@ -252,6 +361,131 @@ def group_by_extension (lst_fnm, no_case):
     return fext
 
 
+def _fext(fnm, no_case):
+    ext = os.path.splitext(fnm)[1][1:]
+    return ext.lower() if no_case else ext
+
+
+def _scan_folder(path):
+    '''Returns the files (path, size, mtime_ns) and the subfolders of the folder provided.'''
+    lst_file, lst_dir = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        lst_dir.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        lst_file.append((entry.path, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue        # Removed while scanning
+    except OSError as e:
+        logger.debug(f'Folder not scanned: {path} ({e})')
+    return lst_file, lst_dir
+
+
+def scan_dir (path, recursive=True, nproc=1, lst_ext=None, no_case=True):
+    '''
+    Lists the files in the folder with os.scandir, reading their size and modification time.
+    
+    Parameters
+    ----------
+    path : str
+        The folder to scan.
+    recursive : bool
+        Whether to scan the subfolders.
+    nproc : int
+        Number of threads scanning folders in parallel (useful for network drives).
+    lst_ext : list, optional
+        Extensions (without dot) of the files to keep. By default all.
+    no_case : bool
+        Whether to lower the case of the extensions before comparing them.
+
+    Return
+    ------
+        Returns a list of (path, size, mtime_ns) tuples, in no particular order.
+    '''
+    lst_res = []
+    if nproc <= 1:
+        lst_dir = [path]
+        while lst_dir:
+            lst_file, lst_sub = _scan_folder(lst_dir.pop())
+            lst_res.extend(lst_file)
+            if recursive: lst_dir.extend(lst_sub)
+    else:
+        with ThreadPoolExecutor(nproc) as pool:
+            pending = {pool.submit(_scan_folder, path)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    lst_file, lst_sub = fut.result()
+                    lst_res.extend(lst_file)
+                    if recursive: pending.update(pool.submit(_scan_folder, d) for d in lst_sub)
+    if lst_ext is not None:
+        set_ext = {ext.lower() if no_case else ext for ext in lst_ext}
+        lst_res = [v for v in lst_res if _fext(v[0], no_case) in set_ext]
+    return lst_res
+
+
+class DirManifest:
+    '''
+    Persistent manifest of the files (path, size and mtime) already processed, so each scan only returns 
+    the new or changed files. The scans are applied to the manifest (and saved) by 'commit', once the 
+    files have been processed.
+
+        man = DirManifest('manifest.pkl')
+        for ext, lst_fnm in man.changes(folder).items(): ...
+        man.commit()
+    
+    Parameters
+    ----------
+    fmanifest : str
+        The manifest file (pickle). It is created on the first commit.
+    '''
+    def __init__(self, fmanifest):
+        self.fmanifest = fmanifest
+        self.entries   = {}         # path -> (size, mtime_ns)
+        self._pending  = []
+        if os.path.exists(fmanifest):
+            with open(fmanifest, 'rb') as f: self.entries = pickle.load(f)
+
+    def changes(self, path, recursive=True, nproc=1, lst_ext=None, no_case=True):
+        '''
+        Scans the folder (see scan_dir) and returns the new or changed files grouped by extension, 
+        as {ext: [path, ...]}.
+        '''
+        lst_scan = scan_dir(path, recursive=recursive, nproc=nproc, lst_ext=lst_ext, no_case=no_case)
+        entries  = self.entries
+        lst_new  = sorted(v[0] for v in lst_scan if entries.get(v[0]) != v[1:])
+        self._pending.append((path, recursive, lst_ext, no_case, lst_scan, len(lst_new)))
+        fext = {}
+        for fnm in lst_new:
+            fext.setdefault(_fext(fnm, no_case), []).append(fnm)
+        return fext
+
+    def commit(self):
+        '''Applies the pending scans to the manifest (removing the deleted files) and saves it if it changed.'''
+        changed = not os.path.exists(self.fmanifest)
+        for path, recursive, lst_ext, no_case, lst_scan, n_new in self._pending:
+            root    = os.path.join(path, '')
+            set_ext = None if lst_ext is None else {ext.lower() if no_case else ext for ext in lst_ext}
+            scanned = {v[0]: v[1:] for v in lst_scan}
+            for fnm in [fnm for fnm in self.entries if fnm.startswith(root) and fnm not in scanned]:
+                if not recursive and os.path.dirname(fnm) != os.path.dirname(root): continue
+                if set_ext is not None and _fext(fnm, no_case) not in set_ext: continue
+                del self.entries[fnm]
+                changed = True
+            if n_new:
+                self.entries.update(scanned)
+                changed = True
+        self._pending = []
+        if not changed: return
+        tmp = f'{self.fmanifest}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f: pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.fmanifest)
+
+
 def rmv_duplicates_dict_of_lists (lst_dict):
     '''
     Remove duplicated entries in the values of a dictionary keeping the last assigned.
@@ -350,10 +584,101 @@ def dms2deg(val, units=True):
             Returns the converted coordinate.
     '''
     direction = {'N':1.0, 'S':-1.0, 'E': 1.0, 'W':-1.0}
-    if units: ncoordew = val.replace(u'°',' ').replace('\'',' ').replace('"',' ')
+    if units: coord = val.replace(u'°',' ').replace('\'',' ').replace('"',' ')
     else:     coord = val[0:2] + ' ' + val[2:4] + ' ' + val[4:-1] + ' ' + val[-1:]
     coord    = coord.split()
     cood_dir = coord.pop()
     coord.extend([0,0,0])
     return (float(coord[0]) + float(coord[1])/60.0 + float(coord[2])/3600.0) * direction[cood_dir]
+
+
+# Character classes of the DMS strings: padding, digit, dot, separator, positive and negative hemisphere, other
+_DMS_PAD, _DMS_DIG, _DMS_DOT, _DMS_SEP, _DMS_POS, _DMS_NEG, _DMS_BAD = range(7)
+
+@functools.lru_cache(maxsize=2)
+def _dms_char_table(units):
+    '''Returns the lookup table from the character code points to the DMS character classes.'''
+    import numpy as np
+    seps  = u'°º\'"′″ \t' if units else ' '
+    table = np.full(max(ord(c) for c in seps + 'z') + 2, _DMS_BAD, dtype=np.uint8)
+    table[0] = _DMS_PAD
+    table[ord('0'):ord('9')+1] = _DMS_DIG
+    table[ord('.')] = _DMS_DOT
+    for c in seps:   table[ord(c)] = _DMS_SEP
+    for c in 'NEne': table[ord(c)] = _DMS_POS
+    for c in 'SWsw': table[ord(c)] = _DMS_NEG
+    return table
+
+def dms2deg_col(values, units=True):
+    ''' Vectorized dms2deg: converts a whole column of coordinates (latitud or longitud) from the 
+        DMS representation to the Degrees one.
+        The strings are scanned one character position at a time for all the entries at once, 
+        accumulating up to 3 numeric segments (degrees, minutes, seconds) and the hemisphere.
+        It is used instead of a regex extraction (pandas str.extract), which runs the regex string by 
+        string and is slower than the scalar dms2deg loop.
+
+        Parameters
+        ----------
+        values : list, np.ndarray or pd.Series
+            The coordinates as strings. Non string entries are considered unparseable.
+        units : bool
+            Defines whether the coordinates provided have units. Ex 3°47'06.8"W
+            If the coordinates have no units, they are expected to have 2 characters per degree and minute 
+            segments. Ex: 034706.8W
+
+        Return
+        ------
+            Returns a float64 np.ndarray with the converted coordinates, NaN for the unparseable entries.
+    '''
+    import numpy as np
+    if getattr(values, 'dtype', None) is not None and values.dtype.kind == 'U': arr = np.asarray(values)
+    else: arr = np.array([v if isinstance(v, str) else '' for v in values], dtype=str)
+    n     = len(arr)
+    if n == 0 or arr.itemsize == 0: return np.full(n, np.nan)
+    # One row per character position, so each step of the scan reads contiguous memory
+    codes = np.ascontiguousarray(arr.view(np.uint32).reshape(n, -1).T)
+    table = _dms_char_table(units)
+    cls   = table[np.minimum(codes, len(table)-1)]
+    digs  = codes.astype(float) - 48.0
+
+    seg   = np.zeros((3, n))            # degrees, minutes and seconds
+    i_seg = np.zeros(n)                 # segment being read
+    cur   = np.zeros(n)                 # value of the number being read
+    scale = np.zeros(n)                 # 0 for the integer part, 10^-k for the k-th decimal
+    in_num= np.zeros(n, dtype=bool)
+    sign  = np.zeros(n)                 # 0 until the hemisphere is read
+    ok    = np.ones(n, dtype=bool)
+
+    def end_number(mask):
+        ok[:] &= ~(mask & (i_seg >= 3))
+        for k in range(3): seg[k] = np.where(mask & (i_seg == k), cur, seg[k])
+        i_seg[:] += mask
+        cur[:]    = np.where(mask, 0.0, cur)
+        scale[:]  = np.where(mask, 0.0, scale)
+
+    for j in range(codes.shape[0]):
+        c   = cls[j]
+        # Without units the minutes and seconds start at fixed positions
+        if not units and j in (2, 4):
+            end_number(in_num)
+            in_num = np.zeros(n, dtype=bool)
+        dig = c == _DMS_DIG
+        dot = c == _DMS_DOT
+        hem = (c == _DMS_POS) | (c == _DMS_NEG)
+        num = dig | dot
+        # Unknown characters, repeated dots or hemispheres, and anything but separators after the hemisphere
+        ok &= (c != _DMS_BAD) & ~(dot & (scale > 0)) & ~(hem & (sign != 0))
+        ok &= (sign == 0) | (c == _DMS_SEP) | (c == _DMS_PAD)
+        if not units: ok &= ~(num & ~in_num & (i_seg*2 != j))
+        end_number(in_num & ~num)
+        frac  = scale > 0
+        cur   = np.where(dig, np.where(frac, cur + digs[j]*scale, cur*10 + digs[j]), cur)
+        scale = np.where(dot, 0.1, np.where(dig & frac, scale/10, scale))
+        sign  = np.where(c == _DMS_POS, 1.0, np.where(c == _DMS_NEG, -1.0, sign))
+        in_num = num
+    end_number(in_num)
+    ok &= (sign != 0) & (i_seg >= 1)
+    res = (seg[0] + seg[1]/60.0 + seg[2]/3600.0) * sign
+    res[~ok] = np.nan
+    return res
     
\ No newline at end of file
@@ -7,7 +7,12 @@
 ## Date  : 22.10.2018
 ##
 
+import os, hashlib, itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy  as np
+import pandas as pd
 import openpyxl
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string, range_boundaries
 
 #########################################################################################
 #
@@ -15,27 +20,265 @@ import openpyxl
 #
 #
 def xls_cell_coord( cell_str ):
-    xy  = openpyxl.utils.coordinate_from_string(cell_str)
-    col = openpyxl.utils.column_index_from_string(xy[0])
+    xy  = coordinate_from_string(cell_str)
+    col = column_index_from_string(xy[0])
     return [xy[1], col]
 
+def _to_rows(values, header=False, index=False):
+    '''Returns the rows (lists of python values) of a 2-D np.ndarray, DataFrame or list of lists.
+       For DataFrames, 'header' and 'index' add the column names and the index.'''
+    if isinstance(values, pd.DataFrame):
+        rows = values.astype(object).where(values.notna(), None).values.tolist()
+        if index: rows = [[idx] + row for idx, row in zip(values.index.tolist(), rows)]
+        if header: rows.insert(0, ([values.index.name] if index else []) + values.columns.tolist())
+        return rows
+    if isinstance(values, np.ndarray):
+        if values.ndim == 1: values = values.reshape(1, -1)
+        return values.tolist()
+    return [list(row) for row in values]
+
 def xls_set_range (sheet, cell_str, values):
-    coord = xls_cell_coord(cell_str)
-    nrow, ncol = values.shape
-    for i in range(nrow):
-        for j in range(ncol):
-            sheet.cell(row=coord[0]+i, column=coord[1]+j).value = values[i,j]
+    '''
+    Writes the 2-D values provided in the sheet, starting at the cell 'cell_str'.
+    The target range is walked with 'iter_rows', instead of looking up each cell.
+
+    Parameters
+    ----------
+    sheet : openpyxl worksheet
+        The worksheet. Write-only worksheets can only append rows, so the values are appended after the 
+        last row written, starting at the column of 'cell_str' (see xls_append_rows).
+    cell_str : str
+        The top left cell of the range. Ex: 'B3'
+    values : np.ndarray, pd.DataFrame or list of lists
+        The values to write.
+    '''
+    rows = _to_rows(values)
+    if sheet.parent.write_only:
+        return xls_append_rows(sheet, rows, coordinate_from_string(cell_str)[0])
+    if not rows or not rows[0]: return
+    row_ini, col_ini = xls_cell_coord(cell_str)
+    ncol = max(len(row) for row in rows)
+    for row_cells, row in zip(sheet.iter_rows(min_row=row_ini, max_row=row_ini+len(rows)-1, 
+                                              min_col=col_ini, max_col=col_ini+ncol-1), rows):
+        for cell, val in zip(row_cells, row):
+            cell.value = val
+
+def xls_append_rows(sheet, rows, col='A'):
+    '''
+    Appends the rows after the last row of the sheet with 'sheet.append', the only way of writing in 
+    write-only worksheets. The rows are consumed lazily, so an iterator (ex. a generator over DataFrame 
+    chunks) keeps the memory flat.
+
+    Parameters
+    ----------
+    sheet : openpyxl worksheet
+        The worksheet (normal or write-only).
+    rows : iterable
+        The rows (iterables of values), or a np.ndarray / pd.DataFrame.
+    col : str, optional
+        The column where the rows start.
+    '''
+    if isinstance(rows, (np.ndarray, pd.DataFrame)): rows = _to_rows(rows)
+    pad = [None]*(column_index_from_string(col)-1)
+    for row in rows:
+        sheet.append(pad + list(row) if pad else row)
 
 def xls_get_range(rg):
     '''Retrieves the values of the range provided.'''
-    #nrow   = len(rg   )
-    ncol   = len(rg[0])
-    lst_rg = []
-    for r in range(0,len(rg)):
-        lst_row = []
-        for c in range(0, ncol):
-            lst_row.append(rg[r][c].value)
-        lst_rg.append(lst_row)
-    return lst_rg
+    return [[cell.value for cell in row] for row in rg]
+
+def xls_read_range(sheet, cell_range=None, as_array=False, header=False):
+    '''
+    Reads the values of a range with 'iter_rows(values_only=True)'. It also works on read-only worksheets.
+
+    Parameters
+    ----------
+    sheet : openpyxl worksheet
+        The worksheet.
+    cell_range : str, optional
+        The range to read. Ex: 'A1:D20'. By default the whole sheet.
+    as_array : bool, optional
+        If True, it returns a np.ndarray instead of a list of lists.
+    header : bool, optional
+        If True, it returns a DataFrame with the first row as column names.
+
+    Return
+    ------
+    The values as list of lists, np.ndarray or pd.DataFrame.
+    '''
+    bounds = {}
+    if cell_range:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+        bounds = dict(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)
+    rows = sheet.iter_rows(values_only=True, **bounds)
+    if header:
+        cols = next(rows, ())
+        return pd.DataFrame([list(row) for row in rows], columns=list(cols))
+    rows = [list(row) for row in rows]
+    if as_array: return np.array(rows, dtype=object) if rows else np.empty((0, 0), dtype=object)
+    return rows
+
+#########################################################################################
+#
+# Streaming of large sheets..............................................................
+#
+#
+def xls_write_df(fout, data, sheet_name='Sheet', header=True, index=False):
+    '''
+    Writes a DataFrame (or an iterable of DataFrame chunks) to a new workbook in write-only mode. 
+    The rows are streamed to disk, so the memory stays flat when 'data' is an iterator of chunks.
+
+    Parameters
+    ----------
+    fout : str
+        The output file.
+    data : pd.DataFrame, np.ndarray or iterable of pd.DataFrame
+        The data to write.
+    sheet_name : str, optional
+        The name of the sheet.
+    header : bool, optional
+        Writes the column names of the first chunk.
+    index : bool, optional
+        Writes the index as first column.
+    '''
+    wb    = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet(sheet_name)
+    if isinstance(data, (pd.DataFrame, np.ndarray)): data = [data]
+    for i, chunk in enumerate(data):
+        xls_append_rows(sheet, _to_rows(chunk, header=header and i == 0, index=index))
+    wb.save(fout)
+
+def xls_read_df(fnm, sheet_name=None, cell_range=None, header=True, chunk_rows=None):
+    '''
+    Reads a sheet into a DataFrame, opening the workbook in read-only mode (cell values, not formulas).
+
+    Parameters
+    ----------
+    fnm : str
+        The workbook file.
+    sheet_name : str, optional
+        The sheet to read. By default the active one.
+    cell_range : str, optional
+        The range to read. Ex: 'A1:D20'. By default the whole sheet.
+    header : bool, optional
+        If True, the first row holds the column names.
+    chunk_rows : int, optional
+        If provided, it returns a generator of DataFrames of 'chunk_rows' rows, keeping the memory flat.
+
+    Return
+    ------
+    A pd.DataFrame, or a generator of pd.DataFrame if 'chunk_rows'.
+    '''
+    if chunk_rows: return _xls_read_chunks(fnm, sheet_name, cell_range, header, chunk_rows)
+    wb = openpyxl.load_workbook(fnm, read_only=True, data_only=True)
+    try:
+        sheet = wb[sheet_name] if sheet_name else wb.active
+        if header: return xls_read_range(sheet, cell_range, header=True)
+        return pd.DataFrame(xls_read_range(sheet, cell_range))
+    finally:
+        wb.close()
+
+def _xls_read_chunks(fnm, sheet_name, cell_range, header, chunk_rows):
+    wb = openpyxl.load_workbook(fnm, read_only=True, data_only=True)
+    try:
+        sheet  = wb[sheet_name] if sheet_name else wb.active
+        bounds = {}
+        if cell_range:
+            min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+            bounds = dict(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)
+        rows = sheet.iter_rows(values_only=True, **bounds)
+        cols = list(next(rows, ())) if header else None
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk: break
+            yield pd.DataFrame(chunk, columns=cols)
+    finally:
+        wb.close()
+
+#########################################################################################
+#
+# Batch ingestion........................................................................
+#
+#
+def file_hash(fnm, block_size=1 << 20):
+    '''Returns the sha1 of the content of the file.'''
+    h = hashlib.sha1()
+    with open(fnm, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _xls_cache_fnm(cache_dir, fnm, spec):
+    '''Returns the cache file of the workbook, keyed by its content hash and the read options.'''
+    key = hashlib.sha1((file_hash(fnm) + repr(spec)).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.pkl')
+
+def _xls_read_typed(fnm, sheet_name, cell_range, header, dtype):
+    '''Reads the sheet of the workbook (read-only mode) and infers the column types.'''
+    df = xls_read_df(fnm, sheet_name=sheet_name, cell_range=cell_range, header=header).infer_objects()
+    for col in df.columns[df.dtypes == object]:
+        try:    df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError): pass
+    if dtype: df = df.astype(dtype)
+    return df
+
+def xls_read_batch(lst_fnm, sheet_name=None, cell_range=None, header=True, dtype=None, nproc=None, 
+                   cache_dir=None, stream=False):
+    '''
+    Reads the same sheet/range of a list of workbooks into typed DataFrames, parsing them in read-only 
+    mode across a process pool.
+
+    Parameters
+    ----------
+    lst_fnm : list
+        The workbook files.
+    sheet_name, cell_range, header :
+        The sheet/range to read in every workbook (see xls_read_df).
+    dtype : dict or type, optional
+        Types to apply after the inference (DataFrame.astype).
+    nproc : int, optional
+        The number of processes. By default the number of CPUs. With 1 the workbooks are read serially.
+    cache_dir : str, optional
+        Folder where the parsed DataFrames are cached by file hash (and read options), so unchanged 
+        workbooks are not parsed again.
+    stream : bool, optional
+        If True, it returns a generator of (fnm, DataFrame) in completion order.
+
+    Return
+    ------
+    A dict {fnm: DataFrame} in the order of 'lst_fnm', or a generator of (fnm, DataFrame) if 'stream'.
+    '''
+    gen = _xls_iter_batch(lst_fnm, (sheet_name, cell_range, header, dtype), nproc, cache_dir)
+    if stream: return gen
+    dc_df = dict(gen)
+    return {fnm: dc_df[fnm] for fnm in lst_fnm}
+
+def _xls_iter_batch(lst_fnm, spec, nproc, cache_dir):
+    # Cached workbooks are yielded first, the rest are parsed
+    lst_todo = []
+    if cache_dir: os.makedirs(cache_dir, exist_ok=True)
+    for fnm in dict.fromkeys(lst_fnm):
+        fcache = _xls_cache_fnm(cache_dir, fnm, spec) if cache_dir else None
+        if fcache and os.path.exists(fcache):
+            yield fnm, pd.read_pickle(fcache)
+        else:
+            lst_todo.append((fnm, fcache))
+
+    def done(fnm, fcache, df):
+        if fcache:
+            tmp = fcache + '.tmp%d' % os.getpid()
+            df.to_pickle(tmp)
+            os.replace(tmp, fcache)
+        return fnm, df
+
+    nproc = min(nproc or os.cpu_count() or 1, len(lst_todo))
+    if nproc <= 1:
+        for fnm, fcache in lst_todo:
+            yield done(fnm, fcache, _xls_read_typed(fnm, *spec))
+        return
+    with ProcessPoolExecutor(nproc) as pool:
+        futures = {pool.submit(_xls_read_typed, fnm, *spec): (fnm, fcache) for fnm, fcache in lst_todo}
+        for fut in as_completed(futures):
+            yield done(*futures[fut], fut.result())
 
 #########################################################################################
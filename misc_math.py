@@ -7,8 +7,16 @@
 ## Date  : 22.10.2018
 ##
 
+import functools
 import numpy as np
 
+WINDOWS = ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']
+# Window length from which the convolutions are computed with FFT instead of directly
+FFT_MIN_LEN = 256
+# Window length from which the flat convolutions are computed with cumulative sums instead of directly.
+# The direct convolution of the short windows is faster and does not accumulate rounding errors.
+CUMSUM_MIN_LEN = 16
+
 def smooth(x, window_len=11, window='hanning'):
     """smooth the data using a window with requested size.
     
@@ -45,16 +53,186 @@ def smooth(x, window_len=11, window='hanning'):
      
     if x.ndim != 1:         raise ValueError("smooth only accepts 1 dimension arrays.")
     if x.size < window_len: raise ValueError("Input vector needs to be bigger than window size.")
-    if not window in ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']:
+    if not window in WINDOWS:
         raise ValueError("Window is on of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")  
     if window_len < 3: return x
 
     s = np.r_[ x[window_len-1:0:-1], x, x[-1:-window_len:-1] ]    
+    return np.convolve(get_window(window, window_len), s, mode='same')
+
+
+@functools.lru_cache(maxsize=128)
+def get_window(window, window_len):
+    '''Returns the normalized window (its values sum 1) of the type and length provided. 
+       The windows are cached, so the returned array is read-only.'''
     if window == 'flat': # moving average
           w = np.ones(window_len,'d')
-    else: w = eval('np.'+window+'(window_len)')
-        
-    return np.convolve(w/w.sum(), s, mode='same')
+    else: w = getattr(np, window)(window_len)
+    w = w/w.sum()
+    w.flags.writeable = False
+    return w
+
+
+def _convolve_valid(seg, w, window):
+    '''Convolves each row of the 2-D array 'seg' (one signal per row) with the window 'w', in 'valid' mode.
+       The long flat windows use cumulative sums, the long windows FFT, and the rest np.convolve per signal.'''
+    n_win = len(w)
+    n_out = seg.shape[1] - n_win + 1
+    if window == 'flat' and n_win >= CUMSUM_MIN_LEN:
+        cs = np.cumsum(seg, axis=1)
+        cs = np.concatenate([np.zeros((seg.shape[0], 1)), cs], axis=1)
+        return (cs[:, n_win:] - cs[:, :-n_win]) * w[0]
+    if n_win >= FFT_MIN_LEN:
+        n_fft = 1 << int(np.ceil(np.log2(seg.shape[1])))
+        res   = np.fft.irfft(np.fft.rfft(seg, n_fft, axis=1) * np.fft.rfft(w, n_fft), n_fft, axis=1)
+        return res[:, n_win-1 : n_win-1+n_out]
+    res = np.empty((seg.shape[0], n_out))
+    for i in range(seg.shape[0]):
+        res[i] = np.convolve(seg[i], w, mode='valid')
+    return res
+
+
+def smooth_nd(x, window_len=11, window='hanning', trim=False):
+    '''Smooths every column of a 2-D array or DataFrame at once (see smooth).
+
+    The columns are padded with reflected copies of the signal as in smooth, and the convolution is 
+    computed for all of them together, using cumulative sums for the flat windows longer than 
+    CUMSUM_MIN_LEN and FFT for the other windows longer than FFT_MIN_LEN.
+
+    Parameters
+    ----------
+        x : numpy array or DataFrame
+            The input signals, one per column (a 1-D array is handled as one column).
+        window_len : int
+            The dimension of the smoothing window. It should be an odd integer.
+        window : string
+            The type of window from 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'.
+        trim : bool, default False
+            Whether to return only the samples aligned with the input (same length as x). Otherwise, 
+            the output has the length returned by smooth (len(x) + 2*(window_len-1)).
+
+    Return
+    ------
+        Returns the smoothed signals with the same type as the input. If a DataFrame is provided and 
+        the output is trimmed, the index is kept.
+    '''
+    is_df = hasattr(x, 'columns')
+    arr   = x.to_numpy(dtype=float) if is_df else np.asarray(x, dtype=float)
+    is_1d = arr.ndim == 1
+    if is_1d: arr = arr[:, None]
+    if arr.ndim != 2:               raise ValueError("smooth_nd only accepts 1 or 2 dimension arrays.")
+    if arr.shape[0] < window_len:   raise ValueError("Input vector needs to be bigger than window size.")
+    if not window in WINDOWS:
+        raise ValueError("Window is on of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")  
+
+    if window_len < 3:
+        res = arr
+    else:
+        w     = get_window(window, window_len)
+        off   = (window_len-1)//2
+        # Reflected signal (as in smooth) padded with zeros to compute the 'same' convolution as a 'valid' 
+        # one. The signals are handled as rows, so they are contiguous in memory.
+        arr_t = arr.T
+        n_sig = arr_t.shape[0]
+        seg   = np.concatenate([np.zeros((n_sig, window_len-1-off)), arr_t[:, window_len-1:0:-1], arr_t, 
+                                arr_t[:, -1:-window_len:-1], np.zeros((n_sig, off))], axis=1)
+        res   = _convolve_valid(seg, w, window).T
+        if trim: res = res[window_len-1 : window_len-1+arr.shape[0]]
+
+    if is_1d: return res[:, 0]
+    if is_df: return type(x)(res, index=x.index if trim or window_len < 3 else None, columns=x.columns)
+    return res
+
+
+class StreamSmoother:
+    '''Stateful smoother taking the samples incrementally, with the same output as smooth over all of them.
+
+    The samples are pushed in blocks, and each call returns the smoothed samples which do not depend on 
+    future samples. As smooth reflects the signal at both ends, nothing is returned until 'window_len' 
+    samples are received, and the last samples are returned by flush(), once the end of the signal is known.
+    Each column of 2-D blocks is smoothed independently.
+
+    Example
+    -------
+    smoother = StreamSmoother(window_len=11)
+    for block in blocks:
+        y = smoother.push(block)
+        ...
+    y = smoother.flush()
+
+    Parameters
+    ----------
+        window_len : int
+            The dimension of the smoothing window. It should be an odd integer.
+        window : string
+            The type of window from 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'.
+    '''
+    def __init__(self, window_len=11, window='hanning'):
+        if not window in WINDOWS:
+            raise ValueError("Window is on of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")  
+        self.window     = window
+        self.window_len = window_len
+        self.w          = get_window(window, window_len) if window_len >= 3 else None
+        self.off        = (window_len-1)//2
+        self._head      = []    # Samples received before having 'window_len' of them
+        self._buf       = None  # Values of the padded signal not yet consumed
+        self._buf_ini   = 0     # Position of the first value of '_buf' in the padded signal
+        self._k_next    = 0     # Position of the next output sample
+        self._tail      = None  # Last 'window_len'-1 samples, used to reflect the end of the signal
+        self._n         = 0     # Number of samples received
+
+    def _append(self, vals):
+        self._buf = vals if self._buf is None else np.concatenate([self._buf, vals])
+
+    def _emit(self, k_last):
+        '''Returns the output samples from '_k_next' to 'k_last', and drops the values not needed anymore.'''
+        if k_last < self._k_next: return self._buf[:0]
+        n_win = self.window_len
+        i_ini = self._k_next + self.off - (n_win-1) - self._buf_ini
+        i_end = k_last + self.off - self._buf_ini + 1
+        res   = _convolve_valid(self._buf[i_ini:i_end].T, self.w, self.window).T
+        self._k_next   = k_last + 1
+        i_keep         = self._k_next + self.off - (n_win-1) - self._buf_ini
+        self._buf      = self._buf[i_keep:]
+        self._buf_ini += i_keep
+        return res
+
+    def push(self, x):
+        '''Adds new samples (1-D array, or 2-D with one column per signal) and returns the smoothed samples available.'''
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1: x = x[:, None]
+        self._n += x.shape[0]
+        if self.window_len < 3: return x
+        n_win = self.window_len
+        if self._buf is None:
+            self._head.append(x)
+            if sum(h.shape[0] for h in self._head) < n_win:
+                return np.zeros((0, x.shape[1]))
+            x = np.concatenate(self._head)
+            self._head = []
+            # Zeros before the signal (the convolution is 'same') and reflected start of the signal
+            self._buf     = np.zeros((n_win-1-self.off, x.shape[1]))
+            self._buf_ini = -(n_win-1-self.off)
+            self._append(x[n_win-1:0:-1])
+        self._append(x)
+        self._tail = np.concatenate([self._tail, x])[-(n_win-1):] if self._tail is not None else x[-(n_win-1):]
+        # Position of the last value known in the padded signal
+        k_last = self._buf_ini + self._buf.shape[0] - 1 - self.off
+        return self._emit(k_last)
+
+    def flush(self):
+        '''Ends the signal and returns the remaining smoothed samples. The smoother is reset afterwards.'''
+        n_win = self.window_len
+        if self.window_len < 3 or self._n == 0:
+            res = np.zeros((0, 1))
+        elif self._buf is None:
+            raise ValueError("Input vector needs to be bigger than window size.")
+        else:
+            self._append(self._tail[::-1])
+            self._append(np.zeros((self.off, self._buf.shape[1])))
+            res = self._emit(self._n + 2*(n_win-1) - 1)
+        self.__init__(self.window_len, self.window)
+        return res
 
 def line_y (x, c, b): return x*c + b
 def line_x (y, c, b): return (y-b)/c
@@ -87,3 +265,46 @@ def line_intersect(m1, b1, m2, b2):
     # y = mx + b
     y = m1 * x + b1
     return [x,y]
+
+def lines_y(x, c, b):
+    '''Vectorized line_y: evaluates the lines 'y = c*x + b' broadcasting 'x', 'c' and 'b' as NumPy arrays.'''
+    return np.multiply(x, c) + np.asarray(b, dtype=float)
+
+def lines_x(y, c, b):
+    '''Vectorized line_x: returns the 'x' where the lines 'y = c*x + b' reach 'y', broadcasting the inputs as
+       NumPy arrays. Horizontal lines (c == 0) give NaN instead of a division warning.'''
+    y, c, b = np.broadcast_arrays(np.asarray(y, dtype=float), np.asarray(c, dtype=float), np.asarray(b, dtype=float))
+    res     = np.full(c.shape, np.nan)
+    ok      = c != 0
+    np.divide(y - b, c, out=res, where=ok)
+    return res
+
+def lines_intersect(m1, b1, m2, b2, return_mask=False):
+    '''
+    Vectorized line_intersect: returns the intersection points between the pairs of lines (m1, b1) and (m2, b2),
+    broadcasting the inputs as NumPy arrays.
+
+    Parameters
+    ----------
+    m1, b1 : array_like
+        The slopes and intersections of the first lines.
+    m2, b2 : array_like
+        The slopes and intersections of the second lines.
+    return_mask : bool, optional
+        If True, it also returns the boolean mask of the pairs that intersect (not parallel).
+
+    Return
+    ------
+    x, y : np.ndarray
+        The coordinates of the intersection points, NaN for parallel lines (where line_intersect returns None).
+    mask : np.ndarray
+        Only if return_mask. True where the lines intersect.
+    '''
+    m1, b1, m2, b2 = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (m1, b1, m2, b2)])
+    dm   = m1 - m2
+    mask = dm != 0
+    x    = np.full(dm.shape, np.nan)
+    np.divide(b2 - b1, dm, out=x, where=mask)
+    y    = m1 * x + b1
+    if return_mask: return x, y, mask
+    return x, y
@@ -5,13 +5,27 @@
 ## Author: Lucas Viani
 ## Date  : 28.11.2019
 ##
-import ray
+import os, time, queue, shutil, tempfile, pickle, hashlib, logging, importlib
 import numpy  as np
 import pandas as pd
 import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger()
 
 NPROC = mp.cpu_count()-1 if mp.cpu_count() > 1 else 1
 
+# Default execution backend and number of workers (see set_backend). They can be set with the 
+# environment variables MISC_MPROC_BACKEND and MISC_MPROC_NPROC. If the backend is None, each
+# function uses its original one (Ray for parallelize_apply and parallelize_calc_ray, and a 
+# process pool for parallelize_calc). The backend of the environment is validated once BACKENDS is defined.
+config = {'backend': os.environ.get('MISC_MPROC_BACKEND') or None,
+          'nproc'  : int(os.environ.get('MISC_MPROC_NPROC', NPROC))}
+
 def apply_mt (func, df, axis):
     return df.apply(func, axis=axis)
 
@@ -20,7 +34,8 @@ def pd_multiply_mt (df, vals, axis=0):
     return df.mul(vals, axis=axis)
 
 
-def parallelize_apply (data, func, nproc=NPROC, axis=0, axis_concat=None):
+def parallelize_apply (data, func, nproc=None, axis=0, axis_concat=None, backend=None, n_blocks=None, weights=None,
+                       stats=None):
     '''Parallelize a func over the data provided.
 
     Example:
@@ -33,41 +48,180 @@ def parallelize_apply (data, func, nproc=NPROC, axis=0, axis_concat=None):
         The data to apply the function over.
     func : function
         The function to be executed.
-    nrpoc : int 
+    nrpoc : int, default config['nproc']
         The number of processes to use.
     axis : int
         The axis to apply the function. 0 applies along the rows, 1 along the columns.
     axis_concat : int or str
         The axis value used in the pd.concat used to merge the results. If None, it is set as 'axis'.
         It may be used when splitting the calculation by columns (axis=1), but it is desired to concatenate by index (axis=1).
+    backend : str or Executor, default config['backend'] or 'ray'
+        The backend used to run the function (see get_executor):
+            'ray'     : the data is loaded in the Ray object store.
+            'shm'     : the numeric columns of the DataFrame are placed in shared memory, and the workers of a local 
+                        process pool use them as zero-copy NumPy views (see _shm_put). Nothing is serialized per task 
+                        but the entries and the results.
+            'process' : the data is split and each split is pickled to a local process pool ('pool' is an alias).
+            'thread'  : the splits are processed by a pool of threads sharing the data.
+            'serial'  : the splits are processed one after the other in the calling process.
+    n_blocks : int, default nproc
+        The number of blocks to split the data into. Using more blocks than processes (e.g. 4*nproc) 
+        balances the load when the cost of the rows varies, as the blocks are scheduled dynamically.
+    weights : str or array-like, default None
+        The cost of each row (or column if axis=1), used to build blocks of similar total cost instead 
+        of the same number of rows. It can be the name of a column of 'data' (only for axis=0).
+        The blocks are contiguous, so the original order is kept when the results are concatenated.
+    stats : JobStats, default None
+        If provided, the timings of the tasks and phases (split, share, compute, concat) are recorded in it.
     '''
     # Handling the default values
+    nproc       = config['nproc'] if nproc is None else nproc
+    backend     = _default_backend(backend, 'ray')
     axis_concat = axis if axis_concat is None else axis_concat
-    # Loading the shared object in Ray
-    data_objId = ray.put(data)
+    stats       = _NoStats() if stats is None else stats
     # Splitting the ROWs or COLUMNs
-    if axis == 0: entry_split = np.array_split([c for c in range(0, data.shape[axis])], nproc)
-    else:         entry_split = np.array_split(data.columns, nproc)
+    with stats.phase('split'):
+        entry_split = _split_entries(data, axis, nproc if n_blocks is None else n_blocks, weights)
+
     # Executing the calculation
-    futures     = [_func_ray.remote(entries, data_objId, func, axis) for entries in entry_split]    
-    lst_res     = ray.get(futures)
-    data        = pd.concat(lst_res, axis=axis_concat)
-
-    # # Multiprocessing
-    # # Splitting the data
-    # data_split = np.array_split(data, nproc, axis=axis)
-    # # Applying the function
-    # pool = mp.Pool(nproc)
-    # # Rebuilding the data
-    # data = pd.concat(pool.map(func, data_split), axis=axis)
-    # pool.close()
-    # pool.join ()
+    if isinstance(backend, str) and backend == 'shm':
+        with stats.phase('share'):
+            lst_shm, meta = _shm_put(data)
+        try:
+            with stats.phase('compute'):
+                with mp.Pool(nproc, initializer=_shm_init, initargs=(meta, stats.wrap(func), axis)) as pool:
+                    # One block per task, so the blocks are scheduled dynamically
+                    lst_res = stats.collect(pool.imap(_func_shm, entry_split, chunksize=1), entry_split)
+        finally:
+            for shm in lst_shm:
+                shm.close()
+                shm.unlink()
+    else:
+        with _executor_scope(backend, nproc) as ex:
+            if ex.shares_data:
+                # Sharing the data and sending only the entries
+                with stats.phase('share'):
+                    data_ref = ex.share(data)
+                with stats.phase('compute'):
+                    lst_res  = stats.map(ex.map, _func_entries, entry_split, data=data_ref, func=func, axis=axis)
+            else:
+                # Splitting the data
+                with stats.phase('share'):
+                    if axis == 0: data_split = [data.iloc[entries] for entries in entry_split]
+                    else:         data_split = [data[entries]      for entries in entry_split]
+                with stats.phase('compute'):
+                    lst_res = stats.map(ex.map, func, data_split)
+    with stats.phase('concat'):
+        data = pd.concat(lst_res, axis=axis_concat)
+    stats.done()
     return data
 
 
-@ray.remote
-def _func_ray (lst_entries, data, func, axis):
-    '''Remote function to be used with ray.
+def _split_entries (data, axis, n_blocks, weights=None):
+    '''Splits the row positions (axis=0) or the column labels (axis=1) of the data into contiguous blocks.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        The data to be split.
+    axis : int
+        0 to split the rows, 1 to split the columns.
+    n_blocks : int
+        The number of blocks.
+    weights : str or array-like, default None
+        The cost of each entry. If None, all the blocks have the same number of entries. Otherwise, the
+        blocks are cut where the cumulative cost crosses multiples of total_cost/n_blocks.
+
+    Return
+    ------
+        Returns the list of blocks, skipping the empty ones.
+    '''
+    entries = np.arange(data.shape[0]) if axis == 0 else data.columns
+    if weights is None:
+        return np.array_split(entries, n_blocks)
+    if isinstance(weights, str):
+        assert axis == 0, 'The weights can be taken from a column only when splitting the rows.'
+        weights = data[weights]
+    weights = np.asarray(weights, dtype=float)
+    assert len(weights) == len(entries), 'One weight per entry expected.'
+    cum     = np.cumsum(np.clip(np.nan_to_num(weights), 0, None))
+    if cum.size == 0 or cum[-1] <= 0:
+        return np.array_split(entries, n_blocks)
+    cuts    = np.searchsorted(cum, cum[-1] * np.arange(1, n_blocks) / n_blocks, side='right')
+    return [blk for blk in np.split(entries, np.unique(cuts)) if len(blk) > 0]
+
+
+#########################################################################################
+# Shared memory backend
+
+# The data rebuilt in each worker from the shared memory (see _shm_init)
+_shm_worker = {}
+
+def _shm_put (df):
+    '''Copies the numeric columns of a DataFrame into shared memory blocks, one per data type.
+       Each block is stored column by column (ncols x nrows), as pandas does internally, so the 
+       workers can rebuild the DataFrame without copying.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        The DataFrame to be shared.
+
+    Return
+    ------
+        Returns the list of SharedMemory objects (to be closed and unlinked by the caller), and the 
+        metadata needed to rebuild the DataFrame in the workers. The non-numeric columns and the index
+        are part of the metadata, so they are pickled once per worker.
+    '''
+    lst_shm = []
+    blocks  = []
+    for dtype, cols in df.columns.to_series().groupby(df.dtypes.values, sort=False):
+        if not (isinstance(dtype, np.dtype) and dtype.kind in 'biufc'): continue
+        cols = list(cols)
+        arr  = df[cols].to_numpy().T
+        shm  = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        lst_shm.append(shm)
+        blocks.append((shm.name, arr.shape, arr.dtype.str, cols))
+    cols_shm = [c for b in blocks for c in b[3]]
+    meta     = {'blocks' : blocks,
+                'df_obj' : df[[c for c in df.columns if c not in cols_shm]],
+                'index'  : df.index,
+                'columns': df.columns}
+    return lst_shm, meta
+
+
+def _shm_init (meta, func, axis):
+    '''Initializer of the workers. Attaches the shared memory blocks and rebuilds the DataFrame.'''
+    lst_df  = []
+    lst_shm = []
+    for name, shape, dtype, cols in meta['blocks']:
+        shm = shared_memory.SharedMemory(name=name)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        lst_df .append(pd.DataFrame(arr.T, index=meta['index'], columns=cols, copy=False))
+        lst_shm.append(shm)
+    if len(lst_df) == 1 and meta['df_obj'].shape[1] == 0:
+        df = lst_df[0] # Zero-copy
+    else:
+        # Several data types. The DataFrame is rebuilt once per worker with the original column order.
+        df = pd.concat(lst_df + [meta['df_obj']], axis=1)[meta['columns']]
+    _shm_worker.update({'df': df, 'shm': lst_shm, 'func': func, 'axis': axis})
+
+
+def _func_shm (lst_entries):
+    '''Function executed by the workers of the shared memory backend.'''
+    df = _shm_worker['df']
+    if _shm_worker['axis'] == 0:
+        # Contiguous rows are sliced to get a view instead of a copy
+        if len(lst_entries) > 0 and lst_entries[-1] - lst_entries[0] == len(lst_entries) - 1:
+            return _shm_worker['func'](df.iloc[lst_entries[0]:lst_entries[-1]+1])
+        return _shm_worker['func'](df.iloc[lst_entries])
+    else:
+        return _shm_worker['func'](df[lst_entries])
+
+
+def _func_entries (lst_entries, data, func, axis):
+    '''Function executed by the workers of the backends sharing the data (Ray, threads, serial).
 
     Example:
     def parallelize_on_rows(data, func, num_of_processes=8):
@@ -83,7 +237,7 @@ def _func_ray (lst_entries, data, func, axis):
     else:         return func(data[lst_entries])
 
 
-def parallelize_calc (lst_split, func, nproc=NPROC):
+def parallelize_calc (lst_split, func, nproc=None, pool=None, backend=None, stats=None):
     '''Parallelize a func over the data provided.
 
     Example:
@@ -96,19 +250,136 @@ def parallelize_calc (lst_split, func, nproc=NPROC):
         List of items to pass to the function
     func : function
         The function to be executed.
-    nrpoc : int 
+    nrpoc : int, default config['nproc']
         The number of processes to use.
+    pool : WorkerPool, default None
+        A persistent pool to run the function. If None, a new pool is created and closed in each call.
+    backend : str or Executor, default config['backend'] or 'process'
+        The backend used to run the function (see get_executor). Ignored if 'pool' is provided.
+    stats : JobStats, default None
+        If provided, the timings of the tasks are recorded in it.
     '''
-    # Applying the function
-    pool = mp.Pool(nproc)
-    # Rebuilding the data
-    data = pool.map(func, lst_split)
-    pool.close()
-    pool.join ()
+    stats = _NoStats() if stats is None else stats
+    if pool is not None:
+        with stats.phase('compute'):
+            data = stats.map(_pool_map(pool), func, lst_split)
+        stats.done()
+        return data
+    nproc   = config['nproc'] if nproc is None else nproc
+    backend = _default_backend(backend, 'process')
+    with _executor_scope(backend, nproc) as ex:
+        with stats.phase('compute'):
+            data = stats.map(ex.map, func, lst_split)
+    stats.done()
     return data
 
 
-def parallelize_calc_ray (lst_split, func, obj_to_share=None, obj_shared=None, func_args=None):
+def _pool_map (pool):
+    '''Returns a map function with the signature of Executor.map for a multiprocessing or Worker pool.'''
+    def _map (func, lst_items, /, **kwargs):
+        return pool.map(partial(func, **kwargs) if kwargs else func, lst_items)
+    return _map
+
+
+def _run_chunk (func, lst_items):
+    '''Runs the function over a chunk of items, returning the results and the elapsed time.'''
+    t_ini   = time.perf_counter()
+    lst_res = [func(item) for item in lst_items]
+    return lst_res, time.perf_counter() - t_ini
+
+
+class WorkerPool:
+    '''Long-lived pool of processes to be reused across calls, avoiding to spawn the processes (and 
+       re-import the modules) every time. The processes are started on the first use.
+
+       The items are sent in chunks which size is adapted to the measured duration of the tasks: the 
+       first chunks have one item, and the following ones are sized to last around 'chunk_time' seconds.
+       Only a few chunks per process are in flight, so the processes finishing earlier take more work.
+
+    Example:
+    with WorkerPool(nproc=4) as pool:
+        for lst_split in lst_batches:
+            lst_res = parallelize_calc(lst_split, func, pool=pool)
+
+    Parameters
+    ----------
+    nrpoc : int, default config['nproc']
+        The number of processes to use.
+    chunk_time : float
+        The target duration of each chunk in seconds.
+    max_chunk : int
+        The maximum number of items per chunk.
+    '''
+    def __init__ (self, nproc=None, chunk_time=0.2, max_chunk=1000):
+        self.nproc      = config['nproc'] if nproc is None else nproc
+        self.chunk_time = chunk_time
+        self.max_chunk  = max_chunk
+        self._pool      = None
+
+    def _get_pool (self):
+        if self._pool is None:
+            self._pool = mp.Pool(self.nproc)
+        return self._pool
+
+    def imap_unordered (self, func, lst_items):
+        '''Runs the function over the items, yielding the tuples (position of the item, result) in completion order.'''
+        pool      = self._get_pool()
+        lst_items = list(lst_items)
+        n_items   = len(lst_items)
+        done_q    = queue.Queue()
+        i_next    = 0
+        n_flight  = 0
+        t_item    = None # Average duration per item
+        n_done    = 0
+        while n_done < n_items:
+            # Submitting chunks up to two per process....................................
+            while i_next < n_items and n_flight < 2*self.nproc:
+                if t_item is None: n_chunk = 1
+                else:              n_chunk = int(self.chunk_time / t_item) if t_item > 0 else self.max_chunk
+                # Leaving work for all the processes at the end
+                n_chunk = max(1, min(n_chunk, self.max_chunk, (n_items - i_next) // (2*self.nproc)))
+                lst_pos = list(range(i_next, min(i_next + n_chunk, n_items)))
+                pool.apply_async(_run_chunk, (func, [lst_items[i] for i in lst_pos]),
+                                 callback=lambda res, lst_pos=lst_pos: done_q.put((lst_pos, res)),
+                                 error_callback=lambda e: done_q.put((None, e)))
+                i_next   += len(lst_pos)
+                n_flight += 1
+            # Collecting the results.....................................................
+            lst_pos, res = done_q.get()
+            n_flight -= 1
+            if lst_pos is None: raise res
+            lst_res, t_chunk = res
+            t_item  = t_chunk / len(lst_pos) if t_item is None else 0.5*t_item + 0.5*t_chunk/len(lst_pos)
+            n_done += len(lst_pos)
+            for pos, r in zip(lst_pos, lst_res):
+                yield pos, r
+
+    def map (self, func, lst_items):
+        '''Runs the function over the items, returning the results in the order of the items.'''
+        lst_items = list(lst_items)
+        lst_res   = [None] * len(lst_items)
+        for pos, r in self.imap_unordered(func, lst_items):
+            lst_res[pos] = r
+        return lst_res
+
+    def shutdown (self):
+        '''Stops the processes. The pool is started again if used afterwards.'''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join ()
+            self._pool = None
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self._pool is not None:
+            self._pool.terminate()
+        self.shutdown()
+
+
+def parallelize_calc_ray (lst_split, func, obj_to_share=None, obj_shared=None, func_args=None, backend=None, stats=None,
+                          max_retries=0, checkpoint_dir=None):
     '''Parallelize a func over the data provided.
 
     Example:
@@ -120,22 +391,632 @@ def parallelize_calc_ray (lst_split, func, obj_to_share=None, obj_shared=None, f
     lst_split : list
         List of items to pass to the function
     func : function
-        The function to be executed.
+        The function to be executed. It can be a Ray remote function or a plain one.
     obj_share : dict
         Dictionary of objects to be loaded as shared in Ray
     func_args : dict
         Dictionary with the extra function's parameters
+    backend : str or Executor, default config['backend'] or 'ray'
+        The backend used to run the function (see get_executor).
+    stats : JobStats, default None
+        If provided, the timings of the tasks and phases (share, compute) are recorded in it.
+    max_retries : int, default 0
+        The number of times a failed block is run again. If larger than 0, or if 'checkpoint_dir' is 
+        provided, the results are collected as the blocks complete, so a failed block does not discard 
+        the rest (see _calc_tolerant). The error of a block failing all the attempts is raised at the end.
+    checkpoint_dir : str, default None
+        The folder where the result of each finished block is stored. A rerun with the same blocks 
+        skips the ones already stored. The folder is not cleaned, it is up to the caller to remove it.
     '''
     # Validating the default arguments...................................................
     obj_to_share = {} if obj_to_share is None else obj_to_share
     obj_shared   = {} if obj_shared   is None else obj_shared  
     func_args    = {} if func_args    is None else func_args   
+    backend      = _default_backend(backend, 'ray')
+    stats        = _NoStats() if stats is None else stats
+
+    with _executor_scope(backend, config['nproc']) as ex:
+        # Setting the shared objects.....................................................
+        ray_shared = {}
+        with stats.phase('share'):
+            for lbl, obj in obj_to_share.items():
+                ray_shared[lbl] = ex.share(obj)
+
+        # Calling the function...........................................................
+        with stats.phase('compute'):
+            job_key = None
+            if checkpoint_dir is not None:
+                job_key = _checkpoint_key(func, {**obj_to_share, **obj_shared, **func_args})
+                if job_key is None:
+                    logger.warning('The function arguments can not be pickled, the blocks are not checkpointed.')
+                    checkpoint_dir = None
+            if max_retries > 0 or checkpoint_dir is not None:
+                lst_res = _calc_tolerant(ex, func, lst_split, max_retries, checkpoint_dir, stats, job_key,
+                                         **ray_shared, **obj_shared, **func_args)
+            else:
+                lst_res = stats.map(ex.map, func, lst_split, **ray_shared, **obj_shared, **func_args)
+    stats.done()
+    return lst_res
+
+
+def _checkpoint_key (func, kwargs):
+    '''Returns the hash identifying the job in the checkpoint names: the function's qualified name and its
+       arguments (the objects shared, not their references). Returns None if they can not be pickled.'''
+    func = _plain_func(func)
+    name = getattr(func, '__qualname__', None)
+    try:
+        # The functions are identified by name (Ray remote ones can not be pickled), the rest by content
+        obj = ('{}.{}'.format(func.__module__, name) if name else func, sorted(kwargs.items(), key=lambda kv: kv[0]))
+        return hashlib.md5(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        return None
+
+
+def _checkpoint_fnm (checkpoint_dir, job_key, pos, block):
+    '''Returns the checkpoint file of a block, named after the job, its position and the hash of its content.
+       Returns None if the block can not be pickled, so it is not checkpointed.'''
+    try:
+        hsh = hashlib.md5(pickle.dumps(block, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        logger.warning('Block {} can not be pickled, it is not checkpointed.'.format(pos))
+        return None
+    return os.path.join(checkpoint_dir, 'block_{:05d}_{}_{}.pkl'.format(pos, job_key, hsh))
+
+
+def _calc_tolerant (ex, func, lst_split, max_retries, checkpoint_dir, stats, job_key, /, **kwargs):
+    '''Runs the function over the blocks collecting the results as they complete, retrying the failed 
+       blocks up to 'max_retries' times, and storing the finished ones in 'checkpoint_dir' if provided.
+       The blocks found in the checkpoint folder (same job key, position and content) are not run again.
+       The tasks are recorded in 'stats' (JobStats or _NoStats).'''
+    lst_split = list(lst_split)
+    lst_res   = [None] * len(lst_split)
+    pending   = list(range(len(lst_split)))
+    # Loading the checkpoints............................................................
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        lst_fnm = [_checkpoint_fnm(checkpoint_dir, job_key, pos, block) for pos, block in enumerate(lst_split)]
+        pending = []
+        for pos, fnm in enumerate(lst_fnm):
+            if fnm is not None and os.path.isfile(fnm):
+                with open(fnm, 'rb') as f:
+                    lst_res[pos] = pickle.load(f)
+            else:
+                pending.append(pos)
+        if len(pending) < len(lst_split):
+            logger.info('{} of {} blocks loaded from the checkpoints.'.format(len(lst_split) - len(pending), len(lst_split)))
+
+    # Running the blocks.................................................................
+    errors = {}
+    for attempt in range(max_retries + 1):
+        if not pending: break
+        if attempt > 0:
+            logger.warning('Retrying {} failed block{} (attempt {} of {}).'.format(len(pending), 's' if len(pending) > 1 else '', attempt, max_retries))
+        errors   = {}
+        t_submit = time.time()
+        task_func, task_kwargs = stats.task(func, kwargs)
+        for i, err, res in ex.imap_unordered(task_func, [lst_split[pos] for pos in pending], **task_kwargs):
+            pos = pending[i]
+            if err is not None:
+                logger.warning('Block {} failed: {}'.format(pos, err))
+                errors[pos] = err
+                continue
+            lst_res[pos] = res = stats.collect([res], [lst_split[pos]], t_submit)[0]
+            if checkpoint_dir is not None and lst_fnm[pos] is not None:
+                with open(lst_fnm[pos] + '.tmp', 'wb') as f:
+                    pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(lst_fnm[pos] + '.tmp', lst_fnm[pos])
+        pending = sorted(errors.keys())
+
+    if errors:
+        logger.error('{} block{} failed after {} attempt{}.'.format(len(errors), 's' if len(errors) > 1 else '', max_retries + 1, 's' if max_retries > 0 else ''))
+        raise errors[pending[0]]
+    return lst_res
+
+
+def _safe_call (item, _safe_func=None, **kwargs):
+    '''Runs the function over the item returning the tuple (error, result), where error is None if successful.'''
+    try:
+        return None, _plain_func(_safe_func)(item, **kwargs)
+    except Exception as e:
+        return e, None
+
+
+#########################################################################################
+# Instrumentation
+
+def _nbytes (obj):
+    '''Returns the size of the object once pickled, or 0 if it can not be pickled.'''
+    try:
+        return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _timed_call (item, _timed_func=None, **kwargs):
+    '''Runs the function over the item recording its timings. Executed by the workers when instrumenting a job.'''
+    start  = time.time()
+    t_wall = time.perf_counter()
+    t_cpu  = time.process_time()
+    res    = _plain_func(_timed_func)(item, **kwargs)
+    rec    = {'start'    : start,
+              'wall'     : time.perf_counter() - t_wall,
+              'cpu'      : time.process_time() - t_cpu,
+              'bytes_out': _nbytes(res),
+              'pid'      : os.getpid()}
+    return res, rec
+
+
+class JobStats:
+    '''Records the timings of the parallelize_* calls to find where the time goes.
+
+       For each task, it records the wall and CPU time in the worker, the time queued before starting,
+       and the bytes of the item sent to the worker and of the result sent back (measured by pickling
+       them, so the instrumentation adds some overhead). It also records the time of the phases of
+       the job: splitting the data, sharing it with the workers, computing and concatenating.
+       The CPU time is the one of the worker process, so with the thread backend it includes the
+       other threads.
+
+    Example:
+    stats = JobStats('daily_kpis')
+    df    = parallelize_apply(df, func, stats=stats)
+    stats.report()    # Dictionary with the totals
+    stats.summary()   # Human-readable summary
+
+    Parameters
+    ----------
+    name : str
+        The name of the job, used in the summary.
+    hook : function, default None
+        Function called with the report (see report) when each job finishes. If None, the summary 
+        is logged in debug level.
+    '''
+    def __init__ (self, name='', hook=None):
+        self.name   = name
+        self.hook   = hook
+        self.tasks  = []
+        self.phases = {}
+
+    @contextmanager
+    def phase (self, name):
+        '''Records the wall time of the block as the phase 'name'.'''
+        t_ini = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t_ini
+
+    def wrap (self, func):
+        '''Returns the function timing each call (see _timed_call).'''
+        return partial(_timed_call, _timed_func=func)
+
+    def task (self, func, kwargs):
+        '''Returns the function and keyword arguments timing each call, to be passed to the executors.
+           Unlike wrap, the function is a plain module-level one, as the Ray backend requires.'''
+        return _timed_call, dict(kwargs, _timed_func=func)
+
+    def map (self, map_func, func, lst_items, /, **kwargs):
+        '''Runs map_func(func, lst_items, **kwargs) timing each task.'''
+        lst_items    = list(lst_items)
+        t_submit     = time.time()
+        func, kwargs = self.task(func, kwargs)
+        out          = map_func(func, lst_items, **kwargs)
+        return self.collect(out, lst_items, t_submit)
+
+    def collect (self, out, lst_items, t_submit=None):
+        '''Stores the records of the timed tasks in 'out' and returns their results.'''
+        t_submit = time.time() if t_submit is None else t_submit
+        lst_res  = []
+        for item, (res, rec) in zip(lst_items, out):
+            rec['queue']    = max(0.0, rec['start'] - t_submit)
+            rec['bytes_in'] = _nbytes(item)
+            self.tasks.append(rec)
+            lst_res.append(res)
+        return lst_res
+
+    def report (self):
+        '''Returns a dictionary with the totals of the job.'''
+        wall = [t['wall'] for t in self.tasks]
+        return {'name'     : self.name,
+                'n_tasks'  : len(self.tasks),
+                'n_workers': len({t['pid'] for t in self.tasks}),
+                'wall'     : sum(wall),
+                'wall_max' : max(wall) if wall else 0.0,
+                'cpu'      : sum(t['cpu'] for t in self.tasks),
+                'queue'    : sum(t['queue'] for t in self.tasks),
+                'bytes_in' : sum(t['bytes_in']  for t in self.tasks),
+                'bytes_out': sum(t['bytes_out'] for t in self.tasks),
+                'phases'   : dict(self.phases)}
+
+    def summary (self):
+        '''Returns a human-readable summary of the job.'''
+        from .misc import format_seconds
+        rep = self.report()
+        fmt = lambda sec: '{} ({:.3f} s)'.format(format_seconds(sec), sec)
+        lst = ['Job {}: {} task{} in {} worker{}'.format(rep['name'], rep['n_tasks'], 's' if rep['n_tasks'] > 1 else '',
+                                                         rep['n_workers'], 's' if rep['n_workers'] > 1 else ''),
+               '   .Tasks  : wall {}, slowest {}, cpu {}, queued {}'.format(fmt(rep['wall']), fmt(rep['wall_max']),
+                                                                            fmt(rep['cpu']), fmt(rep['queue'])),
+               '   .Data   : {:.1f} MB sent, {:.1f} MB received'.format(rep['bytes_in']/1e6, rep['bytes_out']/1e6)]
+        for name, sec in rep['phases'].items():
+            lst.append('   .{:<7}: {}'.format(name.capitalize(), fmt(sec)))
+        return '\n'.join(lst)
+
+    def done (self):
+        '''Called at the end of each job. Calls the hook or logs the summary.'''
+        if self.hook is not None: self.hook(self.report())
+        else:                     logger.debug(self.summary())
+
+
+class _NoStats:
+    '''Stand-in of JobStats when the instrumentation is disabled. It adds no overhead.'''
+    @contextmanager
+    def phase (self, name):
+        yield
+
+    def wrap (self, func):
+        return func
+
+    def task (self, func, kwargs):
+        return func, kwargs
+
+    def map (self, map_func, func, lst_items, /, **kwargs):
+        return map_func(func, lst_items, **kwargs)
+
+    def collect (self, out, lst_items, t_submit=None):
+        return list(out)
+
+    def done (self):
+        pass
+
+
+def parallelize_groupby_files (lst_fnm, key, func, output_folder=None, prefix='', n_partitions=None, chunk_rows=100000,
+                               per_group=False, col_as_object=True, spill_dir=None, nproc=None, backend=None, na_rep=None):
+    '''Out-of-core groupby-apply over a set of CSV files which does not fit in memory at once.
+
+    The files are read in chunks (see misc_pandas.df_or_path) and their rows are hash-partitioned by 
+    'key' into spill files, so all the rows of a key end up in the same partition. Then 'func' is run
+    over each partition in parallel, and the results are exported as they are computed (see 
+    misc_pandas.export_or_append). The memory used by the reading step is bounded by 'chunk_rows', 
+    and the memory of each worker by the size of a partition (around the total size / n_partitions).
+
+    Example:
+    def daily_energy(df):
+        ...
+    lst_out = parallelize_groupby_files(lst_fnm, 'asset', daily_energy, output_folder=out_folder, n_partitions=64)
+
+    Parameters
+    ----------
+    lst_fnm : list
+        The list of CSV files (';' separated). They must have the same columns, in any order.
+    key : str or list
+        The column/s used to partition the rows.
+    func : function
+        The function applied to each partition (or to each group if 'per_group' is True). It receives 
+        a DataFrame and must return a DataFrame. It must be picklable for the process backend.
+    output_folder : str, default None
+        The folder where the results are exported, one file per partition. If None, the results are 
+        returned as DataFrames, so they must fit in memory.
+    prefix : str
+        String prefix added to the output file names.
+    n_partitions : int, default 4*nproc
+        The number of partitions.
+    chunk_rows : int
+        The number of rows read at once from the input files.
+    per_group : bool, default False
+        Whether to apply 'func' to each group of 'key' instead of to the whole partition.
+    col_as_object : bool, default True
+        Whether to load all the columns as object (see misc_pandas.df_or_path).
+    spill_dir : str, default None
+        The folder where the temporary partition files are written. If None, the system temporary folder is used.
+    nrpoc : int, default config['nproc']
+        The number of workers.
+    backend : str or Executor, default config['backend'] or 'process'
+        The backend used to run the function (see get_executor).
+    na_rep : str, default ''
+        Missing data representation in the exported files.
+
+    Return
+    ------
+        Returns the list of output files, or the list of DataFrames if 'output_folder' is None.
+    '''
+    from . import misc_pandas as mpd
+    nproc        = config['nproc'] if nproc is None else nproc
+    n_partitions = 4*nproc if n_partitions is None else n_partitions
+    backend      = _default_backend(backend, 'process')
+    tmp_dir      = tempfile.mkdtemp(prefix='groupby_', dir=spill_dir)
+    try:
+        # Partitioning the rows..........................................................
+        lst_part = [os.path.join(tmp_dir, 'part_{:05d}.csv'.format(i)) for i in range(n_partitions)]
+        has_head = [False] * n_partitions
+        cols     = None # The header of the partition files, taken from the first chunk
+        for fnm in lst_fnm:
+            item_type, it_df = mpd.df_or_path({'df': fnm}, col_as_object=col_as_object, chunk_rows=chunk_rows)
+            if item_type is None: continue
+            for df_chunk in it_df:
+                # The chunks are appended under a single header, so their columns are aligned to it
+                if cols is None: 
+                    cols = list(df_chunk.columns)
+                elif list(df_chunk.columns) != cols:
+                    if set(df_chunk.columns) != set(cols):
+                        raise ValueError('The columns of {} differ from the ones of the first file: {}'.format(fnm, cols))
+                    df_chunk = df_chunk[cols]
+                part = _key_partition(df_chunk, key, n_partitions)
+                for i_part, df_part in df_chunk.groupby(part):
+                    df_part.to_csv(lst_part[i_part], sep=';', index=False, mode='a', header=not has_head[i_part])
+                    has_head[i_part] = True
+                del df_chunk
+        lst_part = [f for f, h in zip(lst_part, has_head) if h]
+
+        # Applying the function per partition............................................
+        with _executor_scope(backend, nproc) as ex:
+            return ex.map(_groupby_partition, lst_part, func=func, key=key, per_group=per_group, col_as_object=col_as_object,
+                          output_folder=output_folder, prefix=prefix, na_rep=na_rep)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _key_partition (df, key, n_partitions):
+    '''Returns the partition of each row of the chunk, hashing a normalized form of the key columns.
+       Each chunk infers its own types (ex. a key column with NaN is float in one chunk and int in another), 
+       so the numeric values are hashed as float and the rest as strings, and a key always gets the same hash.'''
+    df_key = df[[key] if isinstance(key, str) else list(key)]
+    norm   = {}
+    for c in df_key.columns:
+        col = df_key[c]
+        if pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+            num = col.astype(float)
+        else:
+            num = pd.to_numeric(col, errors='coerce').astype(float)
+        norm[c] = num.astype(str).where(num.notna() | col.isna(), col.astype(str))
+    return pd.util.hash_pandas_object(pd.DataFrame(norm), index=False).to_numpy() % n_partitions
+
+
+def _groupby_partition (fpart, func, key, per_group, col_as_object, output_folder, prefix, na_rep):
+    '''Function executed by the workers of parallelize_groupby_files over each partition file.'''
+    from . import misc_pandas as mpd
+    item_type, df = mpd.df_or_path({'df': fpart}, col_as_object=col_as_object)
+    if item_type is None: return None
+    if per_group: df = df.groupby(key, group_keys=False, sort=False).apply(func)
+    else:         df = func(df)
+    if output_folder is None:
+        return df
+    # Exporting the results named after the partition (e.g. <prefix>groupby_part_00003)
+    lbl   = os.path.splitext(os.path.basename(fpart))[0]
+    item  = {'fnm': 'groupby'}
+    mpd.export_or_append(mpd.rt_type['path'], item, {'df': df, 'label': lbl}, prefix, output_folder, [], None, na_rep=na_rep)
+    return os.path.join(output_folder, prefix + 'groupby_' + lbl)
+
+
+#########################################################################################
+# Execution backends
+
+def set_backend (backend=None, nproc=None):
+    '''Sets the default execution backend and number of workers of the module.
+
+    Parameters
+    ----------
+    backend : str
+        One of 'serial', 'thread', 'process', 'shm', 'ray'. If None, each function uses its original backend.
+    nproc : int
+        The number of workers. If None, it is not modified.
+    '''
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError('Backend not supported: ' + str(backend))
+    config['backend'] = backend
+    if nproc is not None: config['nproc'] = nproc
+
+
+def _default_backend (backend, default):
+    '''Returns the backend to be used: the one provided, the one configured, or the function's default.'''
+    if backend is not None: return backend
+    return config['backend'] if config['backend'] is not None else default
+
+
+def _plain_func (func):
+    '''Returns the Python function of a Ray remote function, or the function itself otherwise.'''
+    return func._function if hasattr(func, 'remote') and hasattr(func, '_function') else func
+
+
+class _FuncRef:
+    '''Reference to a module-level function, resolved by name in the worker processes.
+       The name of a Ray remote function is bound to the remote function, so the plain function behind it 
+       cannot be pickled (pickle finds a different object under its name). The workers import it instead.'''
+    def __init__ (self, func):
+        self.module, self.qualname = func.__module__, func.__qualname__
+        if '<locals>' in self.qualname:
+            raise TypeError(f'The remote function {self.qualname} is not defined at module level, so it cannot '
+                            'be run by the process backend. Pass the plain function instead.')
+        self._func = None
+
+    def __getstate__ (self):
+        return {'module': self.module, 'qualname': self.qualname, '_func': None}
+
+    def __call__ (self, *args, **kwargs):
+        if self._func is None:
+            obj = importlib.import_module(self.module)
+            for name in self.qualname.split('.'): obj = getattr(obj, name)
+            self._func = _plain_func(obj)
+        return self._func(*args, **kwargs)
+
+
+def _by_ref (obj):
+    '''Returns a _FuncRef for the Ray remote functions (also inside partial objects), and the object otherwise.'''
+    if hasattr(obj, 'remote') and hasattr(obj, '_function'):
+        return _FuncRef(obj._function)
+    if isinstance(obj, partial):
+        return partial(_by_ref(obj.func), *obj.args, **{k: _by_ref(v) for k, v in obj.keywords.items()})
+    return obj
+
+
+class Executor (ABC):
+    '''Base class of the execution backends. 
+
+       The executors run a function over a list of items with map(func, lst_items, **kwargs), where the
+       keyword arguments are passed to all the calls. The objects needed by all the calls can be shared 
+       once with share(obj) and passed as keyword arguments.
+    '''
+    # Whether the workers access the objects shared without serializing them per task
+    shares_data = True
+
+    def __init__ (self, nproc=None):
+        self.nproc = config['nproc'] if nproc is None else nproc
+
+    def share (self, obj):
+        return obj
+
+    @abstractmethod
+    def map (self, func, lst_items, /, **kwargs):
+        '''Runs the function over the items and returns the list of results, in the order of the items.'''
+
+    def imap_unordered (self, func, lst_items, /, **kwargs):
+        '''Runs the function over the items yielding the tuples (position, error, result) as they complete. 
+           The error is None for the successful items, and the failing ones do not stop the rest.'''
+        for pos, (err, res) in enumerate(self.map(_safe_call, lst_items, _safe_func=func, **kwargs)):
+            yield pos, err, res
+
+    def shutdown (self):
+        pass
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class SerialExecutor (Executor):
+    '''Runs the function in the calling process. Useful for debugging and profiling.'''
+    def map (self, func, lst_items, /, **kwargs):
+        func = _plain_func(func)
+        return [func(item, **kwargs) for item in lst_items]
+
+
+class ThreadExecutor (Executor):
+    '''Runs the function in a pool of threads. Suitable for I/O or functions releasing the GIL (NumPy, pandas).'''
+    def __init__ (self, nproc=None):
+        super().__init__(nproc)
+        self._pool = None
+
+    def map (self, func, lst_items, /, **kwargs):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.nproc)
+        return list(self._pool.map(partial(_plain_func(func), **kwargs), lst_items))
+
+    def imap_unordered (self, func, lst_items, /, **kwargs):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.nproc)
+        futures = {self._pool.submit(_safe_call, item, _safe_func=func, **kwargs): pos for pos, item in enumerate(lst_items)}
+        for fut in as_completed(futures):
+            err, res = fut.result()
+            yield futures[fut], err, res
+
+    def shutdown (self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class ProcessExecutor (Executor):
+    '''Runs the function in a pool of processes (see WorkerPool). The items and arguments are pickled.
+       The Ray remote functions are sent by reference (see _FuncRef), so they must be defined at module level.'''
+    shares_data = False
+
+    def __init__ (self, nproc=None):
+        super().__init__(nproc)
+        self._pool = WorkerPool(self.nproc)
+
+    def map (self, func, lst_items, /, **kwargs):
+        kwargs = {k: _by_ref(v) for k, v in kwargs.items()}
+        return self._pool.map(partial(_by_ref(func), **kwargs), lst_items)
+
+    def imap_unordered (self, func, lst_items, /, **kwargs):
+        kwargs = {k: _by_ref(v) for k, v in kwargs.items()}
+        for pos, (err, res) in self._pool.imap_unordered(partial(_safe_call, _safe_func=_by_ref(func), **kwargs), 
+                                                         lst_items):
+            yield pos, err, res
+
+    def shutdown (self):
+        self._pool.shutdown()
+
+
+class RayExecutor (Executor):
+    '''Runs the function with Ray. The shared objects are loaded in the Ray object store.
+       Ray is imported when the executor is created.'''
+    def __init__ (self, nproc=None):
+        super().__init__(nproc)
+        import ray
+        self._ray    = ray
+        self._remote = {}
+
+    def share (self, obj):
+        return self._ray.put(obj)
+
+    def _as_remote (self, func):
+        '''Returns the Ray remote function of 'func', wrapping it only once.'''
+        if hasattr(func, 'remote'): return func
+        if func not in self._remote:
+            self._remote[func] = self._ray.remote(func)
+        return self._remote[func]
+
+    def map (self, func, lst_items, /, **kwargs):
+        func    = self._as_remote(func)
+        futures = [func.remote(item, **kwargs) for item in lst_items]
+        return self._ray.get(futures)
+
+    def imap_unordered (self, func, lst_items, /, **kwargs):
+        func    = self._as_remote(func)
+        futures = {func.remote(item, **kwargs): pos for pos, item in enumerate(lst_items)}
+        pending = list(futures.keys())
+        while pending:
+            done, pending = self._ray.wait(pending, num_returns=1)
+            for fut in done:
+                err, res = None, None
+                try:
+                    res = self._ray.get(fut)
+                except Exception as e:
+                    err = e
+                yield futures[fut], err, res
+
+
+# The 'shm' backend runs in a local process pool. Only parallelize_apply places the data in shared memory, 
+# the rest of the functions handle it as 'process'.
+BACKENDS = {'serial' : SerialExecutor,
+            'thread' : ThreadExecutor,
+            'process': ProcessExecutor,
+            'pool'   : ProcessExecutor,
+            'shm'    : ProcessExecutor,
+            'ray'    : RayExecutor}
+
+if config['backend'] is not None and config['backend'] not in BACKENDS:
+    raise ValueError('Backend not supported in MISC_MPROC_BACKEND: ' + config['backend'])
+
+
+def get_executor (backend=None, nproc=None):
+    '''Returns an executor of the backend requested.
+
+    Parameters
+    ----------
+    backend : str
+        One of 'serial', 'thread', 'process' ('pool', 'shm'), 'ray'. If None, the configured one is used 
+        (see set_backend), or 'process' if none is configured.
+    nproc : int, default config['nproc']
+        The number of workers.
+    '''
+    backend = _default_backend(backend, 'process')
+    if backend not in BACKENDS:
+        raise ValueError('Backend not supported: ' + str(backend))
+    return BACKENDS[backend](nproc)
 
-    # Setting the shared objects.........................................................
-    ray_shared = {}
-    for lbl, obj in obj_to_share.items():
-        ray_shared[lbl] = ray.put(obj)    
 
-    # Calling the function remote........................................................    
-    futures = [func.remote(block, **ray_shared, **obj_shared, **func_args) for block in lst_split]
-    return ray.get(futures)
\ No newline at end of file
+@contextmanager
+def _executor_scope (backend, nproc):
+    '''Yields the executor of the backend provided. The executors created here are shut down at the end,
+       while the ones provided by the caller are kept alive.'''
+    if isinstance(backend, Executor):
+        yield backend
+    else:
+        ex = get_executor(backend, nproc)
+        try:
+            yield ex
+        finally:
+            ex.shutdown()
@@ -7,11 +7,22 @@
 ## Date  : 22.10.2018
 ##
 
-import os, re, logging
+import os, re, json, glob, hashlib, logging, warnings, datetime, functools, threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import namedtuple
+from collections.abc import Iterator
 
 from utils import global_defs  as glb
 if glb.USE_MODIN: import modin.pandas as pd
 else:             import pandas       as pd
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 logger = logging.getLogger() 
 
@@ -21,13 +32,18 @@ logger = logging.getLogger()
 #
 rt_type = {'none':None, 'path': 0, 'df':1}
 
+# Columnar cache of the CSV files loaded by df_or_path...................................
+CACHE_MAX_BYTES = 2*1024**3 # Size cap of the cache folder
+cache_stats     = {'hit': 0, 'miss': 0, 'evict': 0}
+
 #########################################################################################
 #
 # Functions..............................................................................
 #
 
 
-def df_or_path (item, col_as_object=True):
+def df_or_path (item, col_as_object=True, chunk_rows=None, chunk_bytes=None, infer_types=False, date_fmt=None,
+                cache_dir=None):
     '''
     Check if 'item' is a path or a dataframe.
     If item is a path, it will open the CSV file located at the path.
@@ -36,11 +52,28 @@ def df_or_path (item, col_as_object=True):
     ----------
     item : string or pd.DataFrame
         The path to a CSV file or a dataframe.
+    col_as_object : bool, default True
+        Whether to load all the columns as object.
+    chunk_rows : int, default None
+        If provided, the CSV file is streamed in chunks of 'chunk_rows' rows instead of being loaded at once.
+    chunk_bytes : int, default None
+        Alternative to 'chunk_rows'. The approximated size in bytes of the file read per chunk. 
+        The number of rows per chunk is estimated from the first lines of the file.
+    infer_types : bool, default False
+        If True, the column types (numeric, datetime, categorical) are inferred from a sample of the file
+        (see infer_csv_dtypes) and the file is parsed directly into those types with the fastest engine 
+        available. It overrides 'col_as_object'.
+    date_fmt : str, default None
+        The datetime format used while inferring the datetime columns. Only used if 'infer_types' is True.
+    cache_dir : str, default None
+        If provided, the parsed DataFrame is cached in this folder in Feather format and later loads are
+        served from the cache until the CSV file changes (see cache_load). Not used in streaming mode.
         
     Return
     ------
         Returns the type provided and the pandas DataFrame if avaialable.
         It will return the input type and the DataFrame.
+        In streaming mode, an iterator of DataFrames is returned instead of the DataFrame.
         If the input is not a string neither a DataFrame, or it it was NOT successful loading the CSV file, it returns (None, None).
     '''
     if isinstance(item['df'], str): 
@@ -50,7 +83,21 @@ def df_or_path (item, col_as_object=True):
             # Is the file empty?
             if os.path.getsize(item['df']) > 0:
                 col_types = object if col_as_object else None
-                df        = pd.read_csv(item['df'], dtype=col_types, sep=';')
+                if chunk_rows is None and chunk_bytes is not None:
+                    chunk_rows = rows_per_chunk(item['df'], chunk_bytes)
+                # Loading from the cache if available
+                use_cache = cache_dir is not None and chunk_rows is None
+                if use_cache:
+                    opts = (col_as_object, infer_types, date_fmt)
+                    df   = cache_load(item['df'], cache_dir, opts)
+                    if df is not None:
+                        return rt_type['path'], df
+                if infer_types:
+                    df    = read_csv_typed(item['df'], date_fmt=date_fmt, chunk_rows=chunk_rows)
+                else:
+                    df    = pd.read_csv(item['df'], dtype=col_types, sep=';', chunksize=chunk_rows)
+                if use_cache:
+                    cache_save(df, item['df'], cache_dir, opts)
                 return rt_type['path'], df
             else:
                 logger.warning('File is empty! Skipping it.')
@@ -65,7 +112,292 @@ def df_or_path (item, col_as_object=True):
     else: return rt_type['none'], rt_type['none']
 
 
-def export_or_append (item_type, item, df_info, prefix, output_folder, lst_out, io_mode, na_rep=None):
+def rows_per_chunk (fpath, chunk_bytes, n_sample=1000):
+    '''Estimates the number of rows of a CSV file fitting in the byte budget provided.
+
+        Parameters
+        ----------
+        fpath : str
+            The path to the CSV file.
+        chunk_bytes : int
+            The approximated size in bytes of each chunk.
+        n_sample : int
+            The number of lines used to estimate the average size of a row.
+
+        Return
+        ------
+            Returns the number of rows per chunk (at least 1).
+    '''
+    assert chunk_bytes > 0, 'The chunk size in bytes must be larger than ZERO.'
+    n_bytes = 0
+    n_lines = 0
+    with open(fpath, 'rb') as f:
+        f.readline() # Skipping the header
+        for line in f:
+            n_bytes += len(line)
+            n_lines += 1
+            if n_lines >= n_sample: break
+    if n_lines == 0: return 1
+    return max(1, int(chunk_bytes / (n_bytes / n_lines)))
+
+
+def _cache_fnm (fpath, cache_dir, opts):
+    '''Returns the cache file path of a CSV file and the prefix shared by all its versions.
+
+        The prefix is the hash of the absolute path and the parse options, and the suffix the hash of 
+        its size and modification time, so any change of the file invalidates the entry.
+    '''
+    st     = os.stat(fpath)
+    prefix = hashlib.md5(repr((os.path.abspath(fpath), opts)).encode()).hexdigest()
+    suffix = hashlib.md5(repr((st.st_size, st.st_mtime_ns)).encode()).hexdigest()
+    return os.path.join(cache_dir, prefix + '_' + suffix + '.feather'), prefix
+
+
+def cache_load (fpath, cache_dir, opts=None):
+    '''Loads the cached DataFrame of a CSV file if the file did not change since it was cached.
+
+        Parameters
+        ----------
+        fpath : str
+            The path to the CSV file.
+        cache_dir : str
+            The cache folder.
+        opts : tuple
+            The parse options used while loading the CSV file. Part of the cache key.
+
+        Return
+        ------
+            Returns the cached DataFrame, or None if not found (cache miss).
+    '''
+    if not HAS_PYARROW: return None
+    fcache, _ = _cache_fnm(fpath, cache_dir, opts)
+    if not os.path.isfile(fcache):
+        cache_stats['miss'] += 1
+        return None
+    try:
+        table = feather.read_table(fcache, memory_map=True)
+        df    = _restore_dtypes(table.to_pandas(), table.schema.metadata)
+    except Exception as e:
+        logger.warning('Corrupted cache file, removing it: ' + str(e))
+        os.remove(fcache)
+        cache_stats['miss'] += 1
+        return None
+    os.utime(fcache) # Marking the entry as recently used
+    cache_stats['hit'] += 1
+    logger.debug('Loaded from cache: ' + fpath)
+    return df
+
+
+# Schema metadata key storing the dtypes of the cached DataFrame
+_CACHE_DTYPES_KEY = b'misc_pandas.dtypes'
+
+def _restore_dtypes (df, metadata):
+    '''Casts the columns of a DataFrame loaded from the cache back to the dtypes it was cached with, as
+       pyarrow does not return all of them unchanged (ex. object columns are returned as strings).'''
+    if not metadata or _CACHE_DTYPES_KEY not in metadata: return df
+    dc_type = json.loads(metadata[_CACHE_DTYPES_KEY])
+    for c, t in zip(df.columns, dc_type):
+        if str(df[c].dtype) != t:
+            df[c] = df[c].astype(object if t == 'object' else t)
+    return df
+
+
+def cache_save (df, fpath, cache_dir, opts=None, max_bytes=None):
+    '''Caches the DataFrame of a CSV file in Feather format, removing its outdated versions.
+        The least recently used entries are evicted while the cache is larger than 'max_bytes'.
+
+        Parameters
+        ----------
+        df : DataFrame
+            The DataFrame loaded from 'fpath'.
+        fpath : str
+            The path to the CSV file.
+        cache_dir : str
+            The cache folder.
+        opts : tuple
+            The parse options used while loading the CSV file. Part of the cache key.
+        max_bytes : int, default CACHE_MAX_BYTES
+            The size cap of the cache folder.
+    '''
+    if not HAS_PYARROW:
+        logger.warning('pyarrow is not available. The CSV files are not cached.')
+        return
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+    fcache, prefix = _cache_fnm(fpath, cache_dir, opts)
+    # Removing the outdated versions of the file.........................................
+    for f in glob.glob(os.path.join(cache_dir, prefix + '_*.feather')):
+        if f != fcache: os.remove(f)
+    # Writing through a temporary file so that no partial entry is read..................
+    try:
+        table = pyarrow.Table.from_pandas(df)
+        meta  = dict(table.schema.metadata or {})
+        meta[_CACHE_DTYPES_KEY] = json.dumps([str(t) for t in df.dtypes])
+        feather.write_feather(table.replace_schema_metadata(meta), fcache + '.tmp', compression='uncompressed')
+        os.replace(fcache + '.tmp', fcache)
+    except Exception as e:
+        logger.warning('The DataFrame could not be cached: ' + str(e))
+        if os.path.isfile(fcache + '.tmp'): os.remove(fcache + '.tmp')
+        return
+    # LRU eviction.......................................................................
+    lst_f = [(os.stat(f), f) for f in glob.glob(os.path.join(cache_dir, '*.feather'))]
+    size  = sum(st.st_size for st, _ in lst_f)
+    for st, f in sorted(lst_f, key=lambda x: x[0].st_mtime):
+        if size <= max_bytes: break
+        if f == fcache: continue
+        os.remove(f)
+        size -= st.st_size
+        cache_stats['evict'] += 1
+
+
+def is_chunked (df):
+    '''Returns True if 'df' is an iterator of DataFrames (streaming mode), and False otherwise.'''
+    return isinstance(df, Iterator) and not isinstance(df, pd.DataFrame)
+
+
+def infer_csv_dtypes (fpath, n_sample=10000, date_fmt=None, max_cat_ratio=0.05, sep=';'):
+    '''Infers the column types of a CSV file from a sample of its first rows.
+
+        The numeric columns are checked with dots and commas as decimal separators. As pandas only 
+        accepts one decimal separator per file, the convention found in most columns is kept and the 
+        columns using the other one are left as object (see to_numeric_col).
+
+        Parameters
+        ----------
+        fpath : str
+            The path to the CSV file.
+        n_sample : int
+            The number of rows used to infer the types.
+        date_fmt : str
+            The datetime format. If None, pandas will try to guess it.
+        max_cat_ratio : float
+            Maximum ratio of unique values over the number of rows for a text column to be set as category.
+        sep : str
+            The column separator.
+
+        Return
+        ------
+            Returns a dictionary with the arguments 'dtype', 'parse_dates' and 'decimal' to be passed to pd.read_csv.
+    '''
+    df_smp = pd.read_csv(fpath, dtype=object, sep=sep, nrows=n_sample)
+
+    dc_num  = {'.': {}, ',': {}}
+    lst_dt  = []
+    dc_type = {}
+    for c in df_smp.columns:
+        col = df_smp[c].dropna().str.strip()
+        if col.empty:
+            dc_type[c] = object
+            continue
+        # Numeric columns, first with dot and then with comma as decimal separator.......
+        is_num = False
+        for dec in ['.', ',']:
+            col_num = col if dec == '.' else col.str.replace(',', '.', regex=False)
+            col_num = pd.to_numeric(col_num, errors='coerce')
+            if col_num.notna().all():
+                # Nullable integers, so a missing value after the sample does not break the parsing
+                is_int = dec == '.' and not col.str.contains('.', regex=False).any()
+                dc_num[dec][c] = 'Int64' if is_int else 'float64'
+                is_num = True
+                break
+        if is_num: continue
+        # Datetime columns...............................................................
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore') # Format guessing warnings of pandas
+                col_dt = pd.to_datetime(col, format=date_fmt, errors='coerce')
+            if col_dt.notna().all():
+                lst_dt.append(c)
+                continue
+        except (ValueError, TypeError):
+            pass
+        # Categorical or text columns....................................................
+        dc_type[c] = 'category' if col.nunique() <= max_cat_ratio*len(col) else object
+
+    # Keeping the most common decimal separator..........................................
+    decimal = ',' if len(dc_num[',']) > len(dc_num['.']) else '.'
+    dc_type.update(dc_num[decimal])
+    # Integer columns can be parsed with any decimal separator
+    other = '.' if decimal == ',' else ','
+    for c, t in dc_num[other].items():
+        dc_type[c] = t if t == 'Int64' else object
+
+    return {'dtype': dc_type, 'parse_dates': lst_dt, 'decimal': decimal}
+
+
+def read_csv_typed (fpath, date_fmt=None, chunk_rows=None, n_sample=10000, sep=';'):
+    '''Reads a CSV file parsing the columns directly into the types inferred by infer_csv_dtypes.
+
+        The pyarrow engine is used if available and no chunks are requested, the C engine otherwise.
+        If the typed parsing fails (e.g. a column with a different type after the sample), the types 
+        are relaxed step by step (see _relax_dtypes) and the parsing is retried. In streaming mode the 
+        retry starts at the chunk that failed, so the chunks already yielded are kept.
+
+        Parameters
+        ----------
+        fpath : str
+            The path to the CSV file.
+        date_fmt : str
+            The datetime format. If None, pandas will try to guess it.
+        chunk_rows : int
+            If provided, an iterator of DataFrames with 'chunk_rows' rows is returned.
+        n_sample : int
+            The number of rows used to infer the types.
+        sep : str
+            The column separator.
+
+        Return
+        ------
+            Returns the DataFrame, or an iterator of DataFrames if 'chunk_rows' is provided.
+    '''
+    kwargs = infer_csv_dtypes(fpath, n_sample=n_sample, date_fmt=date_fmt, sep=sep)
+    if date_fmt is not None and kwargs['parse_dates']:
+        kwargs['date_format'] = date_fmt
+    if chunk_rows is not None:
+        return _read_chunks_typed(fpath, sep, chunk_rows, kwargs)
+    engine = 'pyarrow' if HAS_PYARROW else 'c'
+    while True:
+        try:
+            return pd.read_csv(fpath, sep=sep, engine=engine, **kwargs)
+        except (ValueError, TypeError) as e:
+            kwargs = _relax_dtypes(kwargs, e)
+
+
+def _relax_dtypes (kwargs, err):
+    '''Returns the read_csv arguments with less strict types after a parsing error: first the integer 
+       columns as float, then all the columns as object. The error is raised if nothing can be relaxed.'''
+    dc_type = kwargs['dtype']
+    if 'Int64' in dc_type.values():
+        logger.warning('Typed parsing failed, loading the integer columns as float: ' + str(err))
+        return dict(kwargs, dtype={c: 'float64' if t == 'Int64' else t for c, t in dc_type.items()})
+    if kwargs.get('parse_dates') or any(t is not object for t in dc_type.values()):
+        logger.warning('Typed parsing failed, loading the columns as object: ' + str(err))
+        return {'dtype': object}
+    raise err
+
+
+def _read_chunks_typed (fpath, sep, chunk_rows, kwargs):
+    '''Yields the typed chunks of a CSV file. If a chunk fails to parse, the types are relaxed and the 
+       reading is resumed at that chunk, keeping the row numbering.'''
+    n_done = 0
+    while True:
+        reader = pd.read_csv(fpath, sep=sep, engine='c', chunksize=chunk_rows, 
+                             skiprows=range(1, n_done+1), **kwargs)
+        n_ini  = n_done
+        while True:
+            try:
+                df = next(reader)
+            except StopIteration:
+                return
+            except (ValueError, TypeError) as e:
+                kwargs = _relax_dtypes(kwargs, e)
+                break
+            if n_ini: df.index = df.index + n_ini
+            n_done += len(df)
+            yield df
+
+
+def export_or_append (item_type, item, df_info, prefix, output_folder, lst_out, io_mode, na_rep=None, writer=None):
     ''' Auxiliary function intend to be used in the typical function archtecture when 
         a file path or a dataframe is passed to be handled.
 
@@ -75,9 +407,11 @@ def export_or_append (item_type, item, df_info, prefix, output_folder, lst_out,
             The type of item provided (Path, DataFrame, etc). It is described in the dictionary rt_type. 
         item : str or DataFrame
             The item of the type provided in 'item_type'.
-        df_info : Pandas DataFrame or dict
+        df_info : Pandas DataFrame, iterator of DataFrames or dict
             The DataFrame/s modified by the calling function. It will basically replace the DataFrame/s store in 'item' 
             if the 'item_type' is DataFrame.
+            If an iterator of DataFrames is provided (see df_or_path streaming mode), the chunks are written to the 
+            output file as they arrive.
         prefix : str
             String prefix to be added to the file name. It can be used to avoid a possible overwrite of the input file.
         output_folder : string
@@ -88,11 +422,14 @@ def export_or_append (item_type, item, df_info, prefix, output_folder, lst_out,
             The IO type to be considered. Examples are glb.IO_TYPE['FILE'], glb.IO_TYPE['DF'] to export the output tables as files or dataframes.
         na_rep : str, default ''
             Missing data representation argument in to_csv functions of Pandas.
+        writer : AsyncWriter, default None
+            If provided, the file is handed to the background writer and the function returns without 
+            waiting for it to be written. Call writer.flush() or writer.close() to ensure it is written.
     '''
     # Setting the default arguments =====================================================
     if na_rep is None: na_rep = ''
 
-    if isinstance(df_info, pd.DataFrame):
+    if isinstance(df_info, pd.DataFrame) or is_chunked(df_info):
         df_info = {'df': df_info, 'label': '', 'output_fnm': ''}
     else:
         df_info['output_fnm'] = df_info['output_fnm'] if 'output_fnm' in df_info.keys() else ''
@@ -113,49 +450,336 @@ def export_or_append (item_type, item, df_info, prefix, output_folder, lst_out,
         fpath = output_folder if output_folder is not None else os.path.dirname (item['fnm'])
         logger.info('Exporting file: ' + fpath)
         logger.warning('All files are exported under the same filename. Pending to implement a way to label the outputs differently')
-        df_info['df'].to_csv(fpath+'/'+prefix+fname+df_info['label'], sep=';', index=False, na_rep=na_rep )
+        if writer is not None: writer.submit(df_info['df'], fpath+'/'+prefix+fname+df_info['label'], na_rep=na_rep)
+        else:                  write_table  (df_info['df'], fpath+'/'+prefix+fname+df_info['label'], na_rep=na_rep)
     else:
         item.update({'df':df_info['df'], 'label': df_info['label'], 'output_fnm': df_info['output_fnm']})        
         lst_out.append(item)
 
 
+# Compression of the CSV files by extension, as inferred by pandas
+_csv_compression = {'.gz': 'gzip', '.bz2': 'bz2', '.zip': 'zip', '.xz': 'xz', '.zst': 'zstd'}
+
+
+def write_table (df, fout, na_rep='', fmt='csv', compression=None, sync=False):
+    '''Writes a DataFrame, or an iterator of DataFrames, to a file.
+
+        Parameters
+        ----------
+        df : DataFrame or iterator of DataFrames
+            The data to be written. The chunks of an iterator are written one by one, so that only 
+            one chunk is kept in memory.
+        fout : str
+            The output file path.
+        na_rep : str, default ''
+            Missing data representation argument in to_csv functions of Pandas.
+        fmt : str, default 'csv'
+            The output format: 'csv' (';' separated) or 'parquet'.
+        compression : str, default None
+            The compression of the output file. Ex: 'gzip' for CSV files, 'snappy' for Parquet files.
+            If None, the compression of CSV files is inferred from the extension of 'fout' (ex: '.gz').
+        sync : bool, default False
+            Whether to write through a temporary file and force it to disk (fsync) before renaming it
+            to 'fout', so that a file found at 'fout' is always complete.
+    '''
+    assert fmt in ('csv', 'parquet'), 'Output format not supported: ' + str(fmt)
+    fwrite = fout + '.tmp' if sync else fout
+    if fmt == 'csv':
+        # The temporary suffix prevents pandas from inferring the compression from the file name
+        if compression is None:
+            compression = _csv_compression.get(os.path.splitext(fout)[1].lower())
+        if is_chunked(df):
+            for i, df_chunk in enumerate(df):
+                df_chunk.to_csv(fwrite, sep=';', index=False, na_rep=na_rep, compression=compression,
+                                mode='w' if i == 0 else 'a', header=(i == 0))
+        else:
+            df.to_csv(fwrite, sep=';', index=False, na_rep=na_rep, compression=compression)
+    else:
+        if is_chunked(df):
+            import pyarrow.parquet as pq
+            pq_writer = None
+            for df_chunk in df:
+                table = pyarrow.Table.from_pandas(df_chunk, preserve_index=False)
+                if pq_writer is None:
+                    pq_writer = pq.ParquetWriter(fwrite, table.schema, compression=compression or 'snappy')
+                pq_writer.write_table(table)
+            if pq_writer is not None: pq_writer.close()
+        else:
+            df.to_parquet(fwrite, index=False, compression=compression or 'snappy')
+    if sync and os.path.isfile(fwrite):
+        with open(fwrite, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(fwrite, fout)
+
+
+class AsyncWriter:
+    '''Writes DataFrames to files in background threads, so that the caller continues computing.
+
+        The number of pending files is bounded by 'max_pending': submit() blocks while the limit is 
+        reached, keeping the memory of the frames waiting to be written under control.
+        Use it as a context manager, or call close(), to ensure all the files are written.
+
+        Example
+        -------
+        with AsyncWriter(n_workers=4) as writer:
+            for item in lst_items:
+                ...
+                export_or_append(item_type, item, df, prefix, output_folder, lst_out, io_mode, writer=writer)
+
+        Parameters
+        ----------
+        n_workers : int
+            The number of writing threads.
+        max_pending : int, default 2*n_workers
+            The maximum number of files submitted but not yet written.
+        fmt : str, default 'csv'
+            The output format: 'csv' or 'parquet' (see write_table).
+        compression : str, default None
+            The compression of the output files (see write_table).
+        sync : bool, default True
+            Whether to force the files to disk before making them visible (see write_table).
+    '''
+    def __init__ (self, n_workers=2, max_pending=None, fmt='csv', compression=None, sync=True):
+        self.fmt         = fmt
+        self.compression = compression
+        self.sync        = sync
+        self._executor   = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='AsyncWriter')
+        self._slots      = threading.BoundedSemaphore(max_pending if max_pending is not None else 2*n_workers)
+        self._lock       = threading.Lock()
+        self._futures    = set()
+        self._errors     = []
+
+    def submit (self, df, fout, na_rep=''):
+        '''Queues a DataFrame (or an iterator of DataFrames) to be written to 'fout'.'''
+        self._slots.acquire()
+        try:
+            fut = self._executor.submit(write_table, df, fout, na_rep, self.fmt, self.compression, self.sync)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done (self, fut):
+        with self._lock:
+            self._futures.discard(fut)
+            if not fut.cancelled() and fut.exception() is not None:
+                self._errors.append(fut.exception())
+        self._slots.release()
+
+    def flush (self):
+        '''Waits until all the files submitted are written. Raises the first writing error found, if any.'''
+        with self._lock:
+            lst_fut = list(self._futures)
+        wait(lst_fut)
+        with self._lock:
+            lst_err, self._errors = self._errors, []
+        if lst_err:
+            logger.error('{} file{} could not be written.'.format(len(lst_err), 's' if len(lst_err) > 1 else ''))
+            raise lst_err[0]
+
+    def close (self):
+        '''Writes the pending files and stops the writing threads.'''
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 def reduce_remove_merge_dfs (lst_df, func_args):
-    '''Merges the DataFrame in a list and clears the object to save memory.'''
-    if lst_df:
-        if len(lst_df) > 1:
-            for df2 in lst_df[1:]:
-                lst_df[0] = pd.merge(lst_df[0],df2, **func_args)
-                del df2
-        return lst_df[0]
-    return None
-    
+    '''Merges the DataFrame in a list and clears the object to save memory.
 
-def to_numeric_col(col, comma_as_thousand=True, fillna=None):
-    '''Converts the data type of a column to numeric.'''            
-    # Replacing the decimal separator
-    col_str = col.astype(str)
+        The DataFrames are removed from the list as they are consumed, so they can be released 
+        (the list ends up storing only the merged DataFrame). If the frames are merged on unique 
+        keys without overlapping columns, all of them are aligned on the keys and joined at once 
+        (see _kway_join). Otherwise, the inner and outer merges are done in pairs following a tree
+        reduction, so the accumulated DataFrame is not copied once per input, and the rest from
+        left to right.
+
+        Parameters
+        ----------
+        lst_df : list
+            The list of DataFrames to merge.
+        func_args : dict
+            The arguments passed to pd.merge.
+
+        Return
+        ------
+            Returns the merged DataFrame, or None if the list is empty.
+    '''
+    if not lst_df: return None
+    if len(lst_df) > 1:
+        lst_on = _merge_keys(lst_df, func_args)
+        if lst_on is not None and _kway_join_ok(lst_df, lst_on, func_args):
+            df = _kway_join(lst_df, func_args['on'], func_args.get('how', 'inner'))
+        elif lst_on is not None and func_args.get('how', 'inner') in ('inner', 'outer'):
+            # Tree reduction keeping the order of the frames (only valid for associative merges)
+            while len(lst_df) > 1:
+                lst_rnd = []
+                while len(lst_df) > 1:
+                    df1 = lst_df.pop(0)
+                    df2 = lst_df.pop(0)
+                    lst_rnd.append(pd.merge(df1, df2, **func_args))
+                    del df1, df2
+                lst_rnd.extend(lst_df)
+                lst_df[:] = lst_rnd
+                del lst_rnd
+            df = lst_df.pop()
+        else:
+            df = lst_df.pop(0)
+            while lst_df:
+                df = pd.merge(df, lst_df.pop(0), **func_args)
+        lst_df.append(df)
+    return lst_df[0]
+
+
+def _merge_keys (lst_df, func_args):
+    '''Returns the list of keys of the merge if all the frames share them and no other column, and None otherwise.'''
+    if 'on' not in func_args: return None
+    lst_on = func_args['on'] if isinstance(func_args['on'], list) else [func_args['on']]
+    cols   = set()
+    for df in lst_df:
+        c_val = set(df.columns) - set(lst_on)
+        if c_val & cols or not set(lst_on) <= set(df.columns): return None
+        cols |= c_val
+    return lst_on
+
+
+def _kway_join_ok (lst_df, lst_on, func_args):
+    '''Returns True if the DataFrames can be merged with _kway_join giving the same result as pd.merge.'''
+    if set(func_args.keys()) - {'on', 'how'}:                           return False
+    if func_args.get('how', 'inner') not in ('inner', 'left', 'outer'): return False
+    return not any(df.duplicated(subset=lst_on).any() for df in lst_df)
 
-    # Check if commas and dots are found in the numbers =================================    
-    has_comma = False if col_str.str.contains(',').sum() == 0 else True
-    has_dot   = False if col_str.str.contains('.').sum() == 0 else True
+
+def _kway_join (lst_df, on, how):
+    '''Joins all the DataFrames at once aligning them on the unique keys 'on'.
+       The DataFrames are popped from the list while aligned.'''
+    # Resulting keys. The same order as pd.merge: left order for 'inner' and 'left', and sorted for 'outer'.
+    idx = pd.MultiIndex.from_frame(lst_df[0][on]) if isinstance(on, list) else pd.Index(lst_df[0][on])
+    for df in lst_df[1:]:
+        idx_df = pd.MultiIndex.from_frame(df[on]) if isinstance(on, list) else pd.Index(df[on])
+        if   how == 'inner': idx = idx[idx.isin(idx_df)]
+        elif how == 'outer': idx = idx.union(idx_df)
+    if how == 'outer': idx = idx.sort_values()
+    # Columns in the pd.merge order: the ones of the first frame, then the values of the rest
+    lst_on = on if isinstance(on, list) else [on]
+    cols   = list(lst_df[0].columns) + [c for df in lst_df[1:] for c in df.columns if c not in lst_on]
+    # Aligning the frames on the keys and releasing them.................................
+    lst_blk = []
+    while lst_df:
+        df = lst_df.pop(0).set_index(on)
+        lst_blk.append(df.reindex(idx))
+        del df
+    df = pd.concat(lst_blk, axis=1)
+    del lst_blk
+    return df.reset_index()[cols]
     
-    # If commas and dots are found, we adjust the column to endup with
-    # dots as decimal separators 
-    if has_comma and has_dot:
-        if comma_as_thousand: 
-            col_str = col_str.str.replace(',','')
-        else:                 
-            col_str = col_str.str.replace('.','')
-            col_str = col_str.str.replace(',','.')
+
+def _num_convention (has_comma, has_dot, comma_as_thousand, comma_only_decimal=False):
+    '''Returns the decimal and thousands separators given the separators found in a column.
+       Unless 'comma_only_decimal', a column with commas is handled as having both separators.'''
+    if has_comma and (has_dot or not comma_only_decimal):
+        return ('.', ',') if comma_as_thousand else (',', '.')
     elif has_comma:
-        col_str = col_str.str.replace(',','.')
+        return (',', None)
+    return ('.', None)
+
+
+# Replacements to end up with dots as decimal separators, indexed by (decimal, thousands)
+_num_replace = {('.', None): [],
+                (',', None): [(',', '.')],
+                ('.', ','):  [(',', '')],
+                (',', '.'):  [('.', ''), (',', '.')]}
+
+
+def to_numeric_cols (df, cols=None, comma_as_thousand=True, fillna=None, comma_only_decimal=False):
+    '''Converts the data type of several columns to numeric at once.
+
+        The columns are stacked in a single string column, so the separators of all the columns are 
+        detected with one scan per separator. If commas are found in a column, 'comma_as_thousand' 
+        defines whether they are the thousands separators (the dots being the decimal ones) or the decimal 
+        separators (the dots being the thousands ones), as to_numeric_col always did. The columns sharing 
+        the same convention are then cleaned and converted together.
+
+        Parameters
+        ----------
+        df : DataFrame
+            The DataFrame to be handled.
+        cols : list, default None
+            The columns to be converted. If None, all the columns are converted.
+        comma_as_thousand : bool, default True
+            Whether commas are the thousands separators when both commas and dots are found in a column.
+        fillna : float, default None
+            If provided, the NA values are filled with it.
+        comma_only_decimal : bool, default False
+            If True, the commas of the columns without dots are taken as decimal separators ('1,5' is 1.5),
+            whatever 'comma_as_thousand' is.
 
-    # Converting to numeric =============================================================
-    col = pd.to_numeric(col_str, errors='coerce').astype(float)
-    # Handling the NA if requested
+        Return
+        ------
+            Returns the DataFrame with the converted columns, and a dictionary with the decision taken for 
+            each column: the 'decimal' and 'thousands' separators and the number of values that could not 
+            be converted ('n_invalid').
+    '''
+    cols   = list(df.columns) if cols is None else list(cols)
+    df     = df.copy(deep=False)
+    report = {}
+    # Skipping the columns already numeric...............................................
+    lst_c = []
+    for c in cols:
+        if pd.api.types.is_numeric_dtype(df[c].dtype) and not pd.api.types.is_bool_dtype(df[c].dtype):
+            report[c] = {'decimal': None, 'thousands': None, 'n_invalid': 0}
+        else:
+            lst_c.append(c)
+    if lst_c:
+        # Stacking the columns and detecting the separators..............................
+        n_row     = len(df)
+        vals      = df[lst_c].to_numpy(dtype=object).ravel(order='F')
+        is_na     = pd.isna(vals)
+        col_str   = pd.Series(np.where(is_na, 'nan', vals), dtype=object).astype(str)
+        is_na     = is_na.reshape((n_row, len(lst_c)), order='F')
+        has_comma = col_str.str.contains(',', regex=False).to_numpy(dtype=bool).reshape((n_row, len(lst_c)), order='F').any(axis=0)
+        has_dot   = col_str.str.contains('.', regex=False).to_numpy(dtype=bool).reshape((n_row, len(lst_c)), order='F').any(axis=0)
+
+        # Converting the columns sharing the same convention together....................
+        groups = {}
+        for i, c in enumerate(lst_c):
+            conv = _num_convention(has_comma[i], has_dot[i], comma_as_thousand, comma_only_decimal)
+            groups.setdefault(conv, []).append(i)
+        for conv, lst_i in groups.items():
+            idx = np.concatenate([np.arange(i*n_row, (i+1)*n_row) for i in lst_i])
+            grp = col_str.iloc[idx] if len(lst_i) < len(lst_c) else col_str
+            for old, new in _num_replace[conv]:
+                grp = grp.str.replace(old, new, regex=False)
+            # Strict casting is much faster, but it fails if any value is not numeric
+            try:               num = grp.astype(float).to_numpy(dtype=float)
+            except ValueError: num = pd.to_numeric(grp, errors='coerce').to_numpy(dtype=float)
+            num = num.reshape((n_row, len(lst_i)), order='F')
+            for j, i in enumerate(lst_i):
+                c         = lst_c[i]
+                df[c]     = num[:, j]
+                report[c] = {'decimal': conv[0], 'thousands': conv[1],
+                             'n_invalid': int((~is_na[:, i] & np.isnan(num[:, j])).sum())}
+
+    # Handling the NA if requested.......................................................
     if fillna is not None:
-        col = col.fillna(fillna)
-    return col
+        df[cols] = df[cols].fillna(fillna)
+    return df, report
+
+
+def to_numeric_col(col, comma_as_thousand=True, fillna=None):
+    '''Converts the data type of a column to numeric (see to_numeric_cols).'''
+    df, _ = to_numeric_cols(col.to_frame(), comma_as_thousand=comma_as_thousand, fillna=fillna)
+    return df.iloc[:, 0].astype(float).rename(col.name)
 
 
 def get_date(dt_str, tz=0, fmt=None, zero_hour=None):
@@ -175,7 +799,7 @@ def get_date(dt_str, tz=0, fmt=None, zero_hour=None):
     else:              dt = pd.to_datetime(dt_str, format=fmt)
     
     # Ensure that no shift in the hours after tz_localize
-    dt = (dt + pd.Timedelta(hours=-tz)).tz_localize('UTC').tz_convert(tz*3600)
+    dt = (dt + pd.Timedelta(hours=-tz)).tz_localize('UTC').tz_convert(tz_offset(tz))
 
     # Reset the hour.....................................................................
     if zero_hour:        
@@ -183,6 +807,77 @@ def get_date(dt_str, tz=0, fmt=None, zero_hour=None):
     return dt
 
 
+@functools.lru_cache(maxsize=64)
+def tz_offset (tz):
+    '''Returns the fixed-offset timezone object of the UTC offset provided (in hours). The objects are cached.'''
+    return datetime.timezone(datetime.timedelta(hours=tz))
+
+
+def get_dates(dt_col, tz=0, fmt=None, zero_hour=None):
+    '''
+    Vectorized version of get_date to convert a whole column of dates in string shape.
+    dt_col : pd.Series, pd.Index, list or array of str
+        The dates in the string form.
+    tz : int
+        The timezone offset in UTC.
+    fmt : str
+        The date/time format represented by the values of dt_col. If None, pandas will infer it.
+    zero_hour : bool, default False
+        Whether to reset the hour to zero. IT is useful when timezones offset the hour.
+
+    Return
+    ------
+        Returns a pd.Series if a pd.Series is provided, and a pd.DatetimeIndex otherwise.
+    '''
+    # Setting the date-time..............................................................
+    is_series = isinstance(dt_col, pd.Series)
+    dt = pd.to_datetime(dt_col, format=fmt)
+    if not is_series: dt = pd.DatetimeIndex(dt)
+    acc = dt.dt if is_series else dt
+
+    # Shifting to UTC and converting back to the offset keeps the wall time, so the dates
+    # are directly localized in the fixed offset.
+    dt  = acc.tz_localize(tz_offset(tz))
+
+    # Reset the hour.....................................................................
+    if zero_hour:
+        acc = dt.dt if is_series else dt
+        dt  = dt - pd.to_timedelta(np.asarray(acc.hour), unit='h')
+    return dt
+
+
+# Parsed frequency alias: count and unit of the alias, total seconds, and whether its duration 
+# is variable (months, quarters, years), in which case the seconds are the maximum duration.
+FreqAlias = namedtuple('FreqAlias', ['count', 'unit', 'seconds', 'is_variable'])
+
+_re_freq     = re.compile('([0-9]*)([a-zA-Z]+)')
+_var_freq_dd = {'M': 31, 'MS': 31, 'ME': 31, 'Q': 92, 'QS': 92, 'QE': 92, 'A': 366, 'AS': 366, 'Y': 366, 'YS': 366, 'YE': 366}
+
+
+@functools.lru_cache(maxsize=256)
+def parse_freq (freq):
+    '''Parses a frequency alias. The results are cached, so each alias is parsed only once.
+ 
+        Parameters
+        ----------
+        freq : str
+            The frequency alias of interest. Ex: '15min', 'H', '1M'.
+ 
+        Return
+        ------
+            Returns a FreqAlias record.
+    '''
+    re_frq = _re_freq.match(freq)
+    count  = int(re_frq.group(1)) if re_frq is not None and re_frq.group(1) else 1
+    unit   = re_frq.group(2)      if re_frq is not None else freq
+
+    # Handle 'M' (month) freq -- pd.to_timedelta() does not support 'M' freq and has a bug adding some hours to the month. Timedelta
+    # functions are used for fixed time periods (H, T, D, W) not variable ones (1 month could have 28 to 31 days)
+    if unit in _var_freq_dd or freq[-1] == 'M':
+        return FreqAlias(count, unit, count*_var_freq_dd.get(unit, 31)*24.0*3600.0, True)
+    return FreqAlias(count, unit, pd.to_timedelta(count, unit=unit).total_seconds(), False)
+
+
 def get_sec_of_freq (freq):
     '''Returns the total number of seconds corresponding to the frequency alias provided.
  
@@ -195,24 +890,82 @@ def get_sec_of_freq (freq):
         ------
             Returns the total number of seconds.
     '''
-    r      = re.compile("([0-9]+)([a-zA-Z]+)")
-    re_frq = r.match(freq)
- 
-    # Handle 'M' (month) freq -- pd.to_timedelta() does not support 'M' freq and has a bug adding some hours to the month. Timedelta
-    # functions are used for fixed time periods (H, T, D, W) not variable ones (1 month could have 28 to 31 days)
-    if freq[-1] == 'M':
-        if re_frq is not None: secs = int(re_frq.group(1))*31.0*24.0*3600.0
-        else:                  secs = 31.0*24.0*3600.0
-    else:
-        if re_frq is not None: secs = pd.to_timedelta(int(re_frq.group(1)), unit=re_frq.group(2)).total_seconds()
-        else:                  secs = pd.to_timedelta(                   1, unit=freq           ).total_seconds()
-    
-    return secs
+    return parse_freq(freq).seconds
+
+
+def _as_datetime_index (df, date_col=None, date_fmt=None):
+    '''Returns the timestamps of the index or 'date_col' as a DatetimeIndex, parsing them only if needed.'''
+    dates = df.index if date_col is None else df[date_col]
+    if date_fmt or not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format=date_fmt)
+    return pd.DatetimeIndex(dates)
+
+
+def _run_freq (vals, diffs, dominant):
+    '''Returns the frequency alias of the longest run of timestamps without gaps, duplicates or unordered
+       values, as inferred by pandas. This keeps the calendar frequencies (months, etc.) and the canonical 
+       aliases ('D' rather than '24h'). If pandas fails, the alias of the dominant interval is returned.'''
+    bounds = np.concatenate(([0], np.flatnonzero((diffs > dominant) | (diffs <= 0))+1, [vals.size]))
+    i_run  = np.argmax(np.diff(bounds))
+    run    = vals[bounds[i_run]:bounds[i_run+1]]
+    freq   = pd.infer_freq(pd.DatetimeIndex(run)) if run.size >= 3 else None
+    if freq is None:
+        n_day, rem = divmod(int(dominant), 86400 * 10**9)
+        if rem == 0: freq = 'D' if n_day == 1 else '{}D'.format(n_day)
+        else:        freq = pd.tseries.frequencies.to_offset(pd.Timedelta(int(dominant), unit='ns')).freqstr
+    return freq
+
+
+def infer_freq_stats(df, date_col=None, date_fmt=None):
+    ''' Infers the dominant frequency of the timestamps of a Pandas DataFrame using all of them.
+        The differences between consecutive timestamps are computed once over the int64 values,
+        and the most common positive difference is taken as the frequency. Its alias is inferred by
+        pandas over the longest run without gaps, so the calendar frequencies (months, etc.) are also 
+        detected, their 'seconds' being the dominant interval.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            DataFrame which frequency is to be inferred.
+        date_col : None, str
+            Name of the column that contains the timestamps. If None, the index will be used 
+        date_fmt : str
+            Datetime format. Only needed if the timestamps are strings.
+
+        Return
+        ------
+            Returns a dictionary with:
+                'freq'       : the frequency alias (None if it could not be inferred),
+                'seconds'    : the frequency in seconds,
+                'confidence' : the fraction of the intervals matching the frequency,
+                'gaps'       : the positions of the timestamps after a gap (interval larger than the frequency),
+                'duplicates' : the positions of the timestamps equal to the previous one,
+                'unordered'  : the positions of the timestamps before the previous one.
+    '''
+    dates = _as_datetime_index(df, date_col, date_fmt)
+    valid = np.flatnonzero(~dates.isna())
+    vals  = dates.as_unit('ns').asi8[valid]
+    diffs = np.diff(vals)
+    stats = {'freq': None, 'seconds': None, 'confidence': 0.0,
+             'gaps'      : valid[:0],
+             'duplicates': valid[np.flatnonzero(diffs == 0)+1],
+             'unordered' : valid[np.flatnonzero(diffs <  0)+1]}
+    diffs_pos = diffs[diffs > 0]
+    if diffs_pos.size == 0: return stats
+
+    # Dominant interval..................................................................
+    vals_u, counts = np.unique(diffs_pos, return_counts=True)
+    dominant       = vals_u[np.argmax(counts)]
+    stats['freq']       = _run_freq(vals, diffs, dominant)
+    stats['seconds']    = dominant / 1e9
+    stats['confidence'] = counts.max() / diffs.size
+    stats['gaps']       = valid[np.flatnonzero(diffs > dominant)+1]
+    return stats
 
 
 def infer_freq(df, date_col=None, date_fmt=None, n_rows=10):
     ''' Infers the frequency from a Pandas DataFrame using the first 10 rows. If it fails,
-        tries again with the next 10 rows, and so on.
+        the dominant frequency over all the timestamps is used (see infer_freq_stats).
 
         Parameters
         ----------
@@ -227,23 +980,20 @@ def infer_freq(df, date_col=None, date_fmt=None, n_rows=10):
 
         Return
         ------
-            Returns the total number of seconds.
+            Returns the frequency alias, or None if it could not be inferred.
     '''
-    dates = df.index if date_col is None else df[date_col]
-    if date_fmt:
-        dates = pd.to_datetime(dates, format=date_fmt).astype(str)
-    freq = pd.infer_freq(dates[0:n_rows])
+    dates = _as_datetime_index(df, date_col, date_fmt)
+    # The first rows are checked with pandas to detect the calendar frequencies (months, etc.)
+    try:
+        freq = pd.infer_freq(dates[0:n_rows])
+    except (ValueError, TypeError) as e:
+        logger.debug(e)
+        freq = None
     if freq is None:
-        logger.debug('Frequency could not be inferred from first <{}> values. Trying next date ranges...'.format(n_rows))
-        for try_n in range(0, 21):
-            logger.debug('   .Try #{}'.format(try_n))
-            try:
-                freq = pd.infer_freq(dates[try_n*n_rows+1:try_n*n_rows+1+n_rows])
-                if freq:
-                    logger.debug('   .Success!')
-                    break
-            except Exception as e:            
-                logger.warning(e)
+        logger.debug('Frequency could not be inferred from first <{}> values. Using the dominant frequency...'.format(n_rows))
+        stats = infer_freq_stats(pd.DataFrame(index=dates))
+        freq  = stats['freq']
+        logger.debug('   .Frequency <{}> with confidence {:.2f}'.format(freq, stats['confidence']))
 
     return freq
 
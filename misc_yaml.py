@@ -7,22 +7,77 @@
 ## Date  : 22.10.2018
 ##
 
+import os, pickle, hashlib
 import yaml
 
-LOADER = yaml.Loader
-FULL_LOADER = yaml.Loader
+# libyaml (C) loaders and dumper when available, the pure python ones otherwise
+LOADER      = getattr(yaml, 'CLoader'    , yaml.Loader    )
+FULL_LOADER = LOADER
+SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+DUMPER      = getattr(yaml, 'CDumper'    , yaml.Dumper    )
+
+# In-process cache of the parsed files: (path, loader) -> ((mtime_ns, size), pickled data)
+_cache = {}
 
 def dump_yaml (data, fpath):
     '''Dumps data to a yaml file'''
     with open(fpath, 'w') as outfile:
-        yaml.dump(data, outfile, default_flow_style=False)
+        yaml.dump(data, outfile, Dumper=DUMPER, default_flow_style=False)
+
+def load_yaml (fpath, loader=FULL_LOADER, cache=False, snapshot_dir=None):
+    '''
+    Loads a yaml file and returns its content.
+
+    Parameters
+    ----------
+    fpath : str
+        The yaml file.
+    loader : yaml loader, optional
+        The loader. By default the full loader (libyaml one if available).
+    cache : bool, optional
+        If True, the parsed content is kept in memory until the file changes (mtime or size), and each call 
+        returns a fresh copy of it, so the callers can modify their result.
+    snapshot_dir : str, optional
+        Folder of binary (pickle) snapshots of the parsed files. They are used while the file does not change, 
+        so processes loading the same files at startup parse them only once.
+    '''
+    if not cache and not snapshot_dir: return _parse_yaml(fpath, loader)
+    path  = os.path.abspath(fpath)
+    key   = (path, loader.__name__)
+    st    = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if cache and key in _cache and _cache[key][0] == stamp:
+        return pickle.loads(_cache[key][1])
 
-def load_yaml (fpath, loader=FULL_LOADER):
-    '''Loads a yaml file and returns its content.'''
+    blob  = None
+    fsnap = os.path.join(snapshot_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl') if snapshot_dir else None
+    if fsnap and os.path.exists(fsnap):
+        try:
+            with open(fsnap, 'rb') as f: snap_stamp, snap_blob = pickle.load(f)
+            if snap_stamp == stamp: blob = snap_blob
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            pass
+    if blob is None:
+        data = _parse_yaml(path, loader)
+        try:    blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError): return data     # Not cacheable
+        if fsnap:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            tmp = '%s.tmp%d' % (fsnap, os.getpid())
+            with open(tmp, 'wb') as f: pickle.dump((stamp, blob), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fsnap)
+    if cache: _cache[key] = (stamp, blob)
+    return pickle.loads(blob)
+
+def _parse_yaml (fpath, loader):
     with open(fpath, 'r') as stream:
         data = yaml.load(stream, Loader=loader)
     return data
 
+def clear_yaml_cache ():
+    '''Empties the in-process cache of load_yaml.'''
+    _cache.clear()
+
 def export_conf_file (path, title, asset_nm, in_folder, out_folder, out_fnm, file_patt, 
                       io_type_str, feat_time, layers, unique_fnm):
     '''Export the configuration file.'''
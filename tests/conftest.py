@@ -0,0 +1,31 @@
+# The repository is used as the package 'utils.misc' of the projects, which also provide the module
+# 'utils.global_defs'. When the tests run from a checkout of the repository alone, the package 'utils.misc'
+# is created from the repository folder and 'utils.global_defs' is replaced by a stub with the defaults.
+import os, sys, types, importlib, importlib.util
+
+_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_root = os.path.dirname(os.path.dirname(_repo))
+if _root not in sys.path: sys.path.insert(0, _root)
+
+def _alias_package ():
+    try:
+        importlib.import_module('utils.global_defs')
+        importlib.import_module('utils.misc')
+        return
+    except ImportError:
+        pass
+    utils = types.ModuleType('utils')
+    utils.__path__ = []
+    glb   = types.ModuleType('utils.global_defs')
+    glb.USE_MODIN = False
+    utils.global_defs = glb
+    sys.modules['utils'] = utils
+    sys.modules['utils.global_defs'] = glb
+    spec = importlib.util.spec_from_file_location('utils.misc', os.path.join(_repo, '__init__.py'), 
+                                                  submodule_search_locations=[_repo])
+    pkg  = importlib.util.module_from_spec(spec)
+    sys.modules['utils.misc'] = pkg
+    spec.loader.exec_module(pkg)
+    utils.misc = pkg
+
+_alias_package()
@@ -0,0 +1,210 @@
+import os, re, random
+import numpy  as np
+import pytest
+
+from utils.misc import misc
+
+
+def _random_dms (n, units, seed=0):
+    rnd = random.Random(seed)
+    if units:
+        return ['%d°%02d\'%04.1f"%s' % (rnd.randint(0, 179), rnd.randint(0, 59), rnd.uniform(0, 59.9), rnd.choice('NSEW'))
+                for _ in range(n)]
+    return ['%02d%02d%04.1f%s' % (rnd.randint(0, 89), rnd.randint(0, 59), rnd.uniform(0, 59.9), rnd.choice('NSEW'))
+            for _ in range(n)]
+
+
+# dms2deg_col ###########################################################################
+
+@pytest.mark.parametrize('units', [True, False])
+def test_dms2deg_col_matches_scalar(units):
+    vals = _random_dms(5000, units)
+    ref  = np.array([misc.dms2deg(v, units=units) for v in vals])
+    np.testing.assert_allclose(misc.dms2deg_col(vals, units=units), ref)
+    np.testing.assert_allclose(misc.dms2deg_col(np.array(vals), units=units), ref)
+
+
+@pytest.mark.parametrize('val, expected', [
+    ('3°47\'06.8"W'      , -(3 + 47/60 + 6.8/3600)),
+    ('40°25\'01.2"N'     , 40 + 25/60 + 1.2/3600),
+    ('3°W'               , -3.0),
+    ('12°30\'S'          , -12.5),
+    ('  5° 10\' 20" E '  , 5 + 10/60 + 20/3600),
+    ('1.5°N'             , 1.5),
+    ('3°47\'06.8"w'      , -(3 + 47/60 + 6.8/3600)),
+    ('bad'               , np.nan),
+    (None                , np.nan),
+    (7.5                 , np.nan),
+    (''                  , np.nan),
+    ('3°47\'06.8"X'      , np.nan),   # Unknown hemisphere
+    ('3°47\'06.8"W x'    , np.nan),   # Text after the hemisphere
+    ('3°47\'06.8"NS'     , np.nan),   # Two hemispheres
+    ('1°2°3°4°N'         , np.nan),   # Four segments
+    ('1..2N'             , np.nan),
+    ('N'                 , np.nan),
+])
+def test_dms2deg_col_units_cases(val, expected):
+    np.testing.assert_allclose(misc.dms2deg_col([val]), [expected])
+
+
+@pytest.mark.parametrize('val, expected', [
+    ('034706.8W' , -(3 + 47/60 + 6.8/3600)),
+    ('402501.2N' , 40 + 25/60 + 1.2/3600),
+    ('0347W'     , -(3 + 47/60)),
+    ('03W'       , -3.0),
+    ('034706.8 W', -(3 + 47/60 + 6.8/3600)),
+    ('xx'        , np.nan),
+    ('1234567'   , np.nan),
+    ('03 4706.8W', np.nan),
+])
+def test_dms2deg_col_no_units_cases(val, expected):
+    np.testing.assert_allclose(misc.dms2deg_col([val], units=False), [expected])
+
+
+def test_dms2deg_col_empty():
+    assert misc.dms2deg_col([]).shape == (0,)
+    assert misc.dms2deg_col([]).dtype == np.float64
+
+
+# set_blocks ############################################################################
+
+@pytest.mark.parametrize('as_type', [list, np.array, 'series'])
+def test_set_blocks_weighted_array_costs(as_type):
+    costs = [10, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    if as_type == 'series': costs = pytest.importorskip('pandas').Series(costs)
+    else:                   costs = as_type(costs)
+    blocks = misc.set_blocks(list('abcdefghijk'), 2, costs)
+    assert blocks == [['a'], list('bcdefghijk')]
+    assert [list(b) for b in misc.iter_blocks(list('abcdefghijk'), 2, costs)] == blocks
+
+
+def test_set_blocks_weighted_file_sizes(tmp_path):
+    lst_fnm = []
+    for i, size in enumerate([10, 5000, 20, 300000, 7]):
+        fnm = tmp_path / f'f{i}'
+        fnm.write_bytes(b'x' * size)
+        lst_fnm.append(str(fnm))
+    assert misc.set_blocks(lst_fnm, 2, 'size') == [[lst_fnm[3]], [lst_fnm[0], lst_fnm[1], lst_fnm[2], lst_fnm[4]]]
+
+
+def test_set_blocks_unweighted_unchanged():
+    assert misc.set_blocks(list(range(7)), 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert [b.tolist() for b in misc.set_blocks(np.arange(5), 2)] == [[0, 1, 2], [3, 4]]
+
+
+# PatternMatcher ########################################################################
+
+LST_REGEX = ['^P_', r'(ab)\1', '(?i)temp', r'_\d+$']
+ITEMS     = ['P_ac', 'xabab', 'TEMP_mod', 'irr_12', 'other', 'abab_P_', 'p_dc', 'Temp_3']
+
+
+def test_pattern_matcher_fallbacks():
+    matcher = misc.PatternMatcher(LST_REGEX)
+    # The anchored literal prefix is checked with startswith, the backreference prevents the alternation
+    assert matcher.prefixes == ('P_',) and matcher.re_all is None and len(matcher.lst_re) == 3
+    expected = [any(re.search(p, v) for p in LST_REGEX) for v in ITEMS]
+    assert matcher.mask(ITEMS) == expected
+    assert misc.has_pattern(ITEMS + [3], LST_REGEX) == [v for v, m in zip(ITEMS, expected) if m]
+
+
+def test_pattern_matcher_alternation():
+    matcher = misc.PatternMatcher(['^P_', r'_\d+$', 'ac$'])
+    assert matcher.re_all is not None
+    assert matcher.mask(ITEMS) == [any(re.search(p, v) for p in ['^P_', r'_\d+$', 'ac$']) for v in ITEMS]
+
+
+def test_pattern_matcher_which():
+    matcher = misc.PatternMatcher(LST_REGEX)
+    assert matcher.which(ITEMS + [None]) == ['^P_', r'(ab)\1', '(?i)temp', r'_\d+$', None, r'(ab)\1', None, '(?i)temp', None]
+
+
+@pytest.mark.parametrize('lst_regex', [LST_REGEX, ['^P_', r'_\d+$'], ['^P_']])
+@pytest.mark.parametrize('kind', ['index', 'series', 'mixed'])
+def test_pattern_matcher_vectorized_mask(lst_regex, kind):
+    pd       = pytest.importorskip('pandas')
+    matcher  = misc.PatternMatcher(lst_regex)
+    vals     = ITEMS + [None, 7] if kind == 'mixed' else ITEMS
+    items    = pd.Series(vals, dtype=object) if kind == 'series' else pd.Index(vals, dtype=object)
+    res      = matcher.mask(items)
+    assert isinstance(res, np.ndarray) and res.tolist() == [matcher.is_match(v) for v in vals]
+    assert list(matcher.select(items)) == [v for v in vals if matcher.is_match(v)]
+    assert matcher.mask(pd.Index([1, 2])) == [False, False]
+
+
+# scan_dir / DirManifest ################################################################
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'root'
+    for rel, size in [('a.csv', 10), ('b.TXT', 20), ('sub/c.csv', 30), ('sub/deep/d.csv', 40), ('sub/e.xlsx', 50)]:
+        fnm = root / rel
+        fnm.parent.mkdir(parents=True, exist_ok=True)
+        fnm.write_bytes(b'x' * size)
+    return str(root)
+
+
+def _walk (root, recursive=True):
+    lst = []
+    for folder, _, lst_fnm in os.walk(root):
+        lst += [os.path.join(folder, f) for f in lst_fnm]
+        if not recursive: break
+    return sorted(lst)
+
+
+@pytest.mark.parametrize('nproc', [1, 4])
+def test_scan_dir(tree, nproc):
+    lst_scan = misc.scan_dir(tree, nproc=nproc)
+    assert sorted(v[0] for v in lst_scan) == _walk(tree)
+    assert all(v[1] == os.path.getsize(v[0]) and v[2] == os.stat(v[0]).st_mtime_ns for v in lst_scan)
+    assert sorted(v[0] for v in misc.scan_dir(tree, recursive=False, nproc=nproc)) == _walk(tree, recursive=False)
+    lst_txt = [v[0] for v in misc.scan_dir(tree, nproc=nproc, lst_ext=['txt', 'XLSX'])]
+    assert sorted(os.path.basename(f) for f in lst_txt) == ['b.TXT', 'e.xlsx']
+    assert misc.scan_dir(tree, nproc=nproc, lst_ext=['txt'], no_case=False) == []
+
+
+@pytest.mark.parametrize('nproc', [1, 3])
+def test_dir_manifest_changes(tree, tmp_path, monkeypatch, nproc):
+    fman = str(tmp_path / 'manifest.pkl')
+    man  = misc.DirManifest(fman)
+    fext = man.changes(tree, nproc=nproc)
+    assert sorted(fext) == ['csv', 'txt', 'xlsx'] and len(fext['csv']) == 3
+    man.commit()
+    assert len(misc.DirManifest(fman).entries) == 5
+
+    # No change: nothing returned and the manifest is not rewritten
+    man = misc.DirManifest(fman)
+    assert man.changes(tree, nproc=nproc) == {}
+    with monkeypatch.context() as m:
+        m.setattr(misc.pickle, 'dump', lambda *args, **kwargs: pytest.fail('manifest rewritten'))
+        man.commit()
+
+    # New, modified and deleted files
+    (tmp_path / 'root' / 'sub' / 'new.csv').write_bytes(b'y')
+    with open(os.path.join(tree, 'a.csv'), 'ab') as f: f.write(b'more')
+    os.remove(os.path.join(tree, 'sub', 'deep', 'd.csv'))
+    man  = misc.DirManifest(fman)
+    fext = man.changes(tree, nproc=nproc)
+    assert fext == {'csv': sorted([os.path.join(tree, 'a.csv'), os.path.join(tree, 'sub', 'new.csv')])}
+    man.commit()
+    entries = misc.DirManifest(fman).entries
+    assert sorted(entries) == _walk(tree)
+    assert entries[os.path.join(tree, 'a.csv')][0] == 14
+
+    # Only deletions: nothing returned, but the manifest is updated
+    os.remove(os.path.join(tree, 'b.TXT'))
+    man = misc.DirManifest(fman)
+    assert man.changes(tree, nproc=nproc) == {}
+    man.commit()
+    assert sorted(misc.DirManifest(fman).entries) == _walk(tree)
+
+
+def test_dir_manifest_partial_scans_keep_other_entries(tree, tmp_path):
+    fman = str(tmp_path / 'manifest.pkl')
+    man  = misc.DirManifest(fman)
+    man.changes(tree)
+    man.commit()
+    # Scans restricted by extension or depth do not remove the files they do not cover
+    man = misc.DirManifest(fman)
+    assert man.changes(tree, recursive=False, lst_ext=['csv']) == {}
+    man.commit()
+    assert sorted(misc.DirManifest(fman).entries) == _walk(tree)
@@ -0,0 +1,72 @@
+import numpy  as np
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+from utils.misc import misc_excel as mxl
+
+
+def test_set_range_normal_and_write_only(tmp_path):
+    wb = openpyxl.Workbook()
+    mxl.xls_set_range(wb.active, 'B2', np.arange(4.0).reshape(2, 2))
+    assert mxl.xls_read_range(wb.active, 'B2:C3') == [[0.0, 1.0], [2.0, 3.0]]
+
+    fout = str(tmp_path / 'write_only.xlsx')
+    wb   = openpyxl.Workbook(write_only=True)
+    mxl.xls_set_range(wb.create_sheet('data'), 'C1', [[1, 2], [3, 4]])
+    wb.save(fout)
+    assert mxl.xls_read_df(fout, header=False).values.tolist() == [[None, None, 1, 2], [None, None, 3, 4]]
+
+
+def _write_book (fnm, rows):
+    wb = openpyxl.Workbook()
+    for row in [['a', 'b']] + rows:
+        wb.active.append(row)
+    wb.save(fnm)
+
+
+@pytest.fixture
+def books(tmp_path):
+    lst_fnm = []
+    for i in range(3):
+        fnm = str(tmp_path / 'book{}.xlsx'.format(i))
+        _write_book(fnm, [[i, 'x'], [i+1, 'y']])
+        lst_fnm.append(fnm)
+    return lst_fnm
+
+
+def test_read_batch_cache_hits_and_invalidation(books, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    dc_miss   = mxl.xls_read_batch(books, nproc=1, cache_dir=cache_dir)
+    assert list(dc_miss) == books and len(list((tmp_path / 'cache').iterdir())) == 3
+    assert dc_miss[books[1]]['a'].tolist() == [1, 2]
+
+    # Unchanged workbooks are served from the cache
+    read_typed = mxl._xls_read_typed
+    def no_parse (*args): raise AssertionError('parsed again')
+    monkeypatch.setattr(mxl, '_xls_read_typed', no_parse)
+    dc_hit = mxl.xls_read_batch(books + [books[0]], nproc=1, cache_dir=cache_dir)
+    assert list(dc_hit) == books
+    for fnm in books:
+        assert dc_hit[fnm].equals(dc_miss[fnm])
+
+    # A modified workbook, or other read options, are parsed again
+    lst_parsed = []
+    def spy (fnm, *args):
+        lst_parsed.append(fnm)
+        return read_typed(fnm, *args)
+    monkeypatch.setattr(mxl, '_xls_read_typed', spy)
+    _write_book(books[2], [[7, 'z']])
+    dc = mxl.xls_read_batch(books, nproc=1, cache_dir=cache_dir)
+    assert lst_parsed == [books[2]] and dc[books[2]]['a'].tolist() == [7]
+    mxl.xls_read_batch(books, nproc=1, cache_dir=cache_dir, dtype={'a': float})
+    assert lst_parsed == [books[2]] + books
+
+
+def test_read_batch_processes_and_stream(books, tmp_path):
+    dc_serial = mxl.xls_read_batch(books, nproc=1)
+    dc_proc   = mxl.xls_read_batch(books, nproc=2, cache_dir=str(tmp_path / 'cache'))
+    assert list(dc_proc) == books
+    for fnm in books:
+        assert dc_proc[fnm].equals(dc_serial[fnm])
+    dc_stream = dict(mxl.xls_read_batch(books, nproc=2, cache_dir=str(tmp_path / 'cache'), stream=True))
+    assert set(dc_stream) == set(books)
@@ -0,0 +1,49 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+from utils.misc import misc_math as mmt
+
+CASES = [('flat', 5), ('flat', 31), ('hanning', 11), ('hamming', 4), ('blackman', 301), ('bartlett', 2)]
+
+
+@pytest.fixture
+def signals():
+    rng = np.random.default_rng(0)
+    return np.cumsum(rng.normal(size=(1000, 3)), axis=0)
+
+
+@pytest.mark.parametrize('window, window_len', CASES)
+def test_smooth_nd_matches_smooth(signals, window, window_len):
+    res = mmt.smooth_nd(signals, window_len, window)
+    for j in range(signals.shape[1]):
+        np.testing.assert_allclose(res[:, j], mmt.smooth(signals[:, j], window_len, window), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(mmt.smooth_nd(signals[:, 0], window_len, window), res[:, 0])
+
+
+@pytest.mark.parametrize('window, window_len', CASES[:3])
+def test_smooth_nd_trimmed_dataframe(signals, window, window_len):
+    df  = pd.DataFrame(signals, columns=['a', 'b', 'c'], index=pd.date_range('2024-01-01', periods=len(signals), freq='h'))
+    res = mmt.smooth_nd(df, window_len, window, trim=True)
+    assert res.index.equals(df.index) and list(res.columns) == ['a', 'b', 'c']
+    full = mmt.smooth(signals[:, 1], window_len, window)
+    np.testing.assert_allclose(res['b'].to_numpy(), full[window_len-1 : window_len-1+len(df)], rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('window, window_len', CASES)
+@pytest.mark.parametrize('block', [1, 7, 250])
+def test_stream_smoother_matches_smooth(signals, window, window_len, block):
+    if window_len > len(signals) // 2: pytest.skip('window larger than the test signal')
+    smoother = mmt.StreamSmoother(window_len, window)
+    lst_out  = [smoother.push(signals[i:i+block]) for i in range(0, len(signals), block)]
+    lst_out.append(smoother.flush())
+    res = np.concatenate([o for o in lst_out if len(o)])
+    for j in range(signals.shape[1]):
+        np.testing.assert_allclose(res[:, j], mmt.smooth(signals[:, j], window_len, window), rtol=1e-9, atol=1e-9)
+
+
+def test_stream_smoother_short_signal():
+    smoother = mmt.StreamSmoother(11)
+    assert len(smoother.push(np.arange(5.0))) == 0
+    with pytest.raises(ValueError):
+        smoother.flush()
@@ -0,0 +1,204 @@
+import os, sys, inspect, subprocess
+import numpy  as np
+import pandas as pd
+import pytest
+
+from utils.misc import misc_mproc as mmp
+
+
+class _FakeRemote:
+    '''Mimics a Ray remote function: the module-level name is bound to it, not to the plain function.'''
+    def __init__ (self, func):
+        self._function = func
+
+    def remote (self, *args, **kwargs):
+        raise AssertionError('Not expected to run on Ray.')
+
+
+@_FakeRemote
+def add_remote (x, y=0):
+    return x + y
+
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_calc_ray_remote_function_any_backend(backend):
+    res = mmp.parallelize_calc_ray([1, 2, 3], add_remote, func_args={'y': 10}, backend=backend)
+    assert sorted(res) == [11, 12, 13]
+
+
+def test_process_backend_rejects_local_remote_function():
+    @_FakeRemote
+    def local (x):
+        return x
+    with mmp.get_executor('process', 1) as ex:
+        with pytest.raises(TypeError, match='module level'):
+            ex.map(local, [1])
+
+
+def test_executor_is_abstract():
+    with pytest.raises(TypeError):
+        mmp.Executor()
+
+
+def _sum_by_asset (df):
+    return df.groupby('asset', dropna=False)['v'].agg(['sum', 'count']).reset_index()
+
+
+def test_groupby_files_key_in_one_partition(tmp_path):
+    rng = np.random.default_rng(0)
+    lst_fnm = []
+    for i in range(3):
+        df = pd.DataFrame({'asset': rng.integers(0, 20, 1000).astype(float), 'v': 1.0})
+        if i == 1: df.loc[150, 'asset'] = np.nan     # A chunk with a NaN key is read as float
+        else:      df['asset'] = df['asset'].astype(int)
+        fnm = str(tmp_path / f'f{i}.csv')
+        df.to_csv(fnm, sep=';', index=False)
+        lst_fnm.append(fnm)
+    lst_df = mmp.parallelize_groupby_files(lst_fnm, 'asset', _sum_by_asset, n_partitions=8, chunk_rows=100, 
+                                           col_as_object=False, spill_dir=str(tmp_path), backend='serial')
+    res = pd.concat(lst_df).dropna(subset=['asset'])
+    assert res['asset'].is_unique
+    assert res['count'].sum() == 2999
+
+
+def add (x, y=0):
+    return x + y
+
+
+def mul (x, y=1):
+    return x * y
+
+
+def test_checkpoints_keyed_by_function_and_arguments(tmp_path):
+    ckpt = str(tmp_path / 'ckpt')
+    assert mmp.parallelize_calc_ray([1, 2], add, func_args={'y': 10}, backend='serial', checkpoint_dir=ckpt) == [11, 12]
+    # A different function or different arguments must not reuse the stored blocks
+    assert mmp.parallelize_calc_ray([1, 2], mul, func_args={'y': 10}, backend='serial', checkpoint_dir=ckpt) == [10, 20]
+    assert mmp.parallelize_calc_ray([1, 2], add, func_args={'y': 20}, backend='serial', checkpoint_dir=ckpt) == [21, 22]
+    # The same job reuses them
+    n_files = len(list((tmp_path / 'ckpt').iterdir()))
+    assert mmp.parallelize_calc_ray([1, 2], add, func_args={'y': 10}, backend='serial', checkpoint_dir=ckpt) == [11, 12]
+    assert len(list((tmp_path / 'ckpt').iterdir())) == n_files == 6
+
+
+def test_unpicklable_block_is_not_checkpointed(tmp_path):
+    ckpt = str(tmp_path / 'ckpt')
+    res  = mmp.parallelize_calc_ray([1, lambda: 2], lambda x: x if x == 1 else x(), backend='serial', checkpoint_dir=ckpt)
+    assert res == [1, 2]
+
+
+def test_tolerant_path_records_stats():
+    stats = mmp.JobStats('tolerant')
+    assert mmp.parallelize_calc_ray([1, 2, 3], add, backend='thread', stats=stats, max_retries=1) == [1, 2, 3]
+    assert stats.report()['n_tasks'] == 3
+
+
+class _RayLikeExecutor (mmp.SerialExecutor):
+    '''Like Ray, only accepts plain functions as tasks (ray.remote rejects partial objects).'''
+    def imap_unordered (self, func, lst_items, /, **kwargs):
+        if not inspect.isfunction(func):
+            raise TypeError('ray.remote() expects a function, got ' + type(func).__name__)
+        return super().imap_unordered(func, lst_items, **kwargs)
+
+
+@pytest.mark.parametrize('stats', [None, mmp.JobStats('tolerant')])
+def test_tolerant_path_passes_plain_functions(stats):
+    res = mmp.parallelize_calc_ray([1, 2, 3], add, func_args={'y': 1}, backend=_RayLikeExecutor(), stats=stats, 
+                                   max_retries=1)
+    assert res == [2, 3, 4]
+    if stats is not None: assert stats.report()['n_tasks'] == 3
+
+
+def _square (x):
+    return x * x
+
+
+def _pid (_):
+    return os.getpid()
+
+
+def _fail_on_3 (x):
+    if x == 3: raise ValueError('item 3')
+    return x
+
+
+def test_worker_pool_map_keeps_order_and_reuses_processes():
+    with mmp.WorkerPool(nproc=2, chunk_time=0.01, max_chunk=7) as pool:
+        assert pool.map(_square, range(200)) == [x * x for x in range(200)]
+        lst_pos = [pos for pos, _ in pool.imap_unordered(_square, range(50))]
+        assert sorted(lst_pos) == list(range(50))
+        pids_1 = set(pool.map(_pid, range(20)))
+        pids_2 = set(pool.map(_pid, range(20)))
+        assert len(pids_1 | pids_2) <= 2
+    assert pool._pool is None
+
+
+def test_worker_pool_raises_task_error_and_restarts():
+    pool = mmp.WorkerPool(nproc=2)
+    with pytest.raises(ValueError, match='item 3'):
+        pool.map(_fail_on_3, range(10))
+    pool.shutdown()
+    assert pool.map(_square, [1, 2]) == [1, 4]
+    pool.shutdown()
+
+
+def test_parallelize_calc_with_worker_pool():
+    with mmp.WorkerPool(nproc=2) as pool:
+        assert mmp.parallelize_calc(list(range(10)), _square, pool=pool) == [x * x for x in range(10)]
+
+
+@pytest.mark.parametrize('backend', ['shm', 'process', 'serial'])
+def test_set_backend_used_by_all_functions(backend):
+    old = dict(mmp.config)
+    try:
+        mmp.set_backend(backend, nproc=2)
+        assert mmp.WorkerPool().nproc == 2
+        assert mmp.parallelize_calc(list(range(5)), _square) == [0, 1, 4, 9, 16]
+        assert sorted(mmp.parallelize_calc_ray([1, 2], add_remote, func_args={'y': 1})) == [2, 3]
+        df = pd.DataFrame({'a': np.arange(10.0)})
+        pd.testing.assert_frame_equal(mmp.parallelize_apply(df, _square), df ** 2)
+    finally:
+        mmp.config.update(old)
+
+
+def test_backend_validation():
+    with pytest.raises(ValueError):
+        mmp.set_backend('bogus')
+    code = ('import sys; sys.path.insert(0, {!r}); import conftest\n'
+            'from utils.misc import misc_mproc').format(os.path.dirname(os.path.abspath(__file__)))
+    res  = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, 
+                          env=dict(os.environ, MISC_MPROC_BACKEND='bogus'))
+    assert res.returncode != 0 and 'MISC_MPROC_BACKEND' in res.stderr
+
+
+@pytest.mark.parametrize('weights', [None, 'w', np.ones(0)])
+def test_split_entries_empty_frame(weights):
+    df = pd.DataFrame({'w': np.ones(0)})
+    assert all(len(blk) == 0 for blk in mmp._split_entries(df, 0, 4, weights))
+
+
+def test_split_entries_weighted_balances_cost():
+    w      = np.r_[np.full(10, 100.0), np.ones(990)]
+    blocks = mmp._split_entries(pd.DataFrame({'w': w}), 0, 4, 'w')
+    assert np.concatenate(blocks).tolist() == list(range(1000))
+    assert max(w[blk].sum() for blk in blocks) < 0.5 * w.sum()
+
+
+def _identity (df):
+    return df
+
+
+def test_groupby_files_aligns_columns(tmp_path):
+    df1 = pd.DataFrame({'asset': [1, 2, 3], 'v': [1.0, 2.0, 3.0], 'w': ['a', 'b', 'c']})
+    df2 = pd.DataFrame({'w': ['d', 'e'], 'asset': [1, 4], 'v': [4.0, 5.0]})
+    df1.to_csv(tmp_path / 'f1.csv', sep=';', index=False)
+    df2.to_csv(tmp_path / 'f2.csv', sep=';', index=False)
+    lst_df = mmp.parallelize_groupby_files([str(tmp_path / 'f1.csv'), str(tmp_path / 'f2.csv')], 'asset', _identity, 
+                                           n_partitions=2, col_as_object=False, backend='serial')
+    res = pd.concat(lst_df).sort_values('w').reset_index(drop=True)
+    pd.testing.assert_frame_equal(res, pd.concat([df1, df2[df1.columns]], ignore_index=True))
+
+    df2.drop(columns='w').to_csv(tmp_path / 'f3.csv', sep=';', index=False)
+    with pytest.raises(ValueError, match='f3.csv'):
+        mmp.parallelize_groupby_files([str(tmp_path / 'f1.csv'), str(tmp_path / 'f3.csv')], 'asset', _identity, 
+                                      backend='serial')
@@ -0,0 +1,138 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+from utils.misc import misc_pandas as mpd
+
+
+@pytest.fixture
+def fcsv(tmp_path):
+    n  = 500
+    df = pd.DataFrame({'a': np.arange(n).astype(object), 
+                       'b': np.linspace(0, 1, n).round(3),
+                       't': pd.date_range('2024-01-01', periods=n, freq='min').strftime('%Y-%m-%d %H:%M'),
+                       's': np.where(np.arange(n) % 2, 'x', 'y')})
+    df.loc[400, 'a'] = None
+    fpath = tmp_path / 'data.csv'
+    df.to_csv(fpath, sep=';', index=False)
+    return str(fpath)
+
+
+@pytest.mark.skipif(not mpd.HAS_PYARROW, reason='pyarrow is required by the cache')
+@pytest.mark.parametrize('opts', [{}, {'col_as_object': False}, {'infer_types': True}])
+def test_cache_hit_equals_miss(fcsv, tmp_path, opts):
+    cache_dir = str(tmp_path / 'cache')
+    n_hit     = mpd.cache_stats['hit']
+    _, df_miss = mpd.df_or_path({'df': fcsv}, cache_dir=cache_dir, **opts)
+    _, df_hit  = mpd.df_or_path({'df': fcsv}, cache_dir=cache_dir, **opts)
+    assert mpd.cache_stats['hit'] == n_hit + 1
+    assert (df_hit.dtypes == df_miss.dtypes).all()
+    assert df_hit.equals(df_miss)
+
+
+@pytest.mark.parametrize('vals, comma_as_thousand, expected', [
+    (['1,234', '5,678'], True , [1234.0, 5678.0]),
+    (['1,5']           , True , [15.0]),
+    (['1,5']           , False, [1.5]),
+    (['1.234,5', '7']  , False, [1234.5, 7.0]),
+    (['1,234.5', None] , True , [1234.5, np.nan]),
+    (['a', '1.5']      , True , [np.nan, 1.5]),
+])
+def test_to_numeric_col_keeps_separator_decisions(vals, comma_as_thousand, expected):
+    res = mpd.to_numeric_col(pd.Series(vals, dtype=object), comma_as_thousand=comma_as_thousand)
+    np.testing.assert_allclose(res.to_numpy(), expected)
+
+
+def test_to_numeric_cols_comma_only_decimal():
+    df, report = mpd.to_numeric_cols(pd.DataFrame({'a': ['1,5', '2,25'], 'b': ['1,234.5', '3']}), 
+                                     comma_only_decimal=True)
+    np.testing.assert_allclose(df['a'].to_numpy(), [1.5, 2.25])
+    np.testing.assert_allclose(df['b'].to_numpy(), [1234.5, 3.0])
+    assert report['a']['decimal'] == ',' and report['b']['thousands'] == ','
+
+
+@pytest.mark.parametrize('tz, zero_hour', [(0, None), (1, None), (-5, None), (2, True)])
+@pytest.mark.parametrize('as_series', [True, False])
+def test_get_dates_matches_get_date(tz, zero_hour, as_series):
+    vals = ['2024-01-01 00:30', '2024-03-31 01:15', '2024-06-15 23:59', '2024-10-27 02:00']
+    res  = mpd.get_dates(pd.Series(vals) if as_series else vals, tz=tz, fmt='%Y-%m-%d %H:%M', zero_hour=zero_hour)
+    assert isinstance(res, pd.Series if as_series else pd.DatetimeIndex)
+    expected = [mpd.get_date(v, tz=tz, fmt='%Y-%m-%d %H:%M', zero_hour=zero_hour) for v in vals]
+    assert list(res) == expected
+    assert all(str(r.tz) == str(e.tz) for r, e in zip(res, expected))
+
+
+# Frequencies given by infer_freq before the dominant interval fallback (pd.infer_freq over windows of rows)
+@pytest.mark.parametrize('dates, expected', [
+    (pd.date_range('2024-01-01', periods=60, freq='D').delete(5)           , 'D'),
+    (pd.date_range('2020-01-31', periods=40, freq='ME').delete(4)          , 'ME'),
+    (pd.date_range('2020-01-01', periods=40, freq='MS').delete(4)          , 'MS'),
+    (pd.date_range('2024-01-01', periods=60, freq='h').delete([3, 30])     , 'h'),
+    (pd.date_range('2024-01-01', periods=60, freq='15min').delete([2, 25])  , '15min'),
+])
+def test_infer_freq_gappy_series_match_baseline(dates, expected):
+    df = pd.DataFrame({'v': np.arange(len(dates))}, index=dates)
+    assert mpd.infer_freq(df) == expected
+    assert mpd.infer_freq_stats(df)['freq'] == expected
+
+
+def test_infer_freq_stats_gaps_and_duplicates():
+    dates = pd.date_range('2024-01-01', periods=20, freq='D').delete(5).insert(10, pd.Timestamp('2024-01-11'))
+    stats = mpd.infer_freq_stats(pd.DataFrame(index=dates))
+    assert stats['freq'] == 'D' and stats['seconds'] == 86400
+    assert list(stats['gaps']) == [5] and list(stats['duplicates']) == [10]
+
+
+@pytest.mark.parametrize('how', ['inner', 'left', 'outer'])
+@pytest.mark.parametrize('on', ['k', ['k', 'j']])
+def test_kway_join_matches_sequential_merge(how, on):
+    rng   = np.random.default_rng(0)
+    lst_k = [rng.permutation(20)[:15] for _ in range(3)]
+    lst_df = [pd.DataFrame({'x': rng.normal(size=15), 'k': lst_k[0], 'j': lst_k[0] % 3}),
+              pd.DataFrame({'k': lst_k[1], 'j': lst_k[1] % 3, 'y': rng.normal(size=15)}),
+              pd.DataFrame({'z': rng.normal(size=15), 'j': lst_k[2] % 3, 'k': lst_k[2]})]
+    if not isinstance(on, list): lst_df = [df.drop(columns='j') for df in lst_df]
+    assert mpd._kway_join_ok(lst_df, mpd._merge_keys(lst_df, {'on': on}), {'on': on, 'how': how})
+    expected = lst_df[0]
+    for df in lst_df[1:]:
+        expected = pd.merge(expected, df, on=on, how=how)
+    res = mpd.reduce_remove_merge_dfs(list(lst_df), {'on': on, 'how': how})
+    assert list(res.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(res.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('sync', [False, True])
+@pytest.mark.parametrize('chunked', [False, True])
+def test_write_table_infers_gzip(tmp_path, sync, chunked):
+    df   = pd.DataFrame({'a': np.arange(100), 'b': np.linspace(0, 1, 100)})
+    fout = str(tmp_path / 'out.csv.gz')
+    mpd.write_table(iter([df.iloc[:50], df.iloc[50:]]) if chunked else df, fout, sync=sync)
+    with open(fout, 'rb') as f:
+        assert f.read(2) == b'\x1f\x8b'
+    pd.testing.assert_frame_equal(pd.read_csv(fout, sep=';'), df)
+    assert not (tmp_path / 'out.csv.gz.tmp').exists()
+
+
+def test_async_writer_flush_writes_all(tmp_path):
+    lst_df = [pd.DataFrame({'a': np.arange(i, i+10)}) for i in range(6)]
+    with mpd.AsyncWriter(n_workers=2, max_pending=2) as writer:
+        for i, df in enumerate(lst_df):
+            writer.submit(df, str(tmp_path / 'f{}.csv'.format(i)))
+        writer.flush()
+        for i, df in enumerate(lst_df):
+            pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'f{}.csv'.format(i), sep=';'), df)
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_async_writer_raises_errors_once(tmp_path):
+    df     = pd.DataFrame({'a': [1, 2]})
+    writer = mpd.AsyncWriter(n_workers=1)
+    writer.submit(df, str(tmp_path / 'missing' / 'f.csv'))
+    writer.submit(df, str(tmp_path / 'ok.csv'))
+    with pytest.raises(OSError):
+        writer.flush()
+    assert (tmp_path / 'ok.csv').exists()
+    # The errors are reported once and the writer keeps working
+    writer.submit(df, str(tmp_path / 'ok2.csv'))
+    writer.close()
+    assert (tmp_path / 'ok2.csv').exists()
@@ -0,0 +1,63 @@
+import os
+import pytest
+
+pytest.importorskip('yaml')
+from utils.misc import misc_yaml as myml
+
+
+@pytest.fixture
+def fyaml(tmp_path):
+    myml.clear_yaml_cache()
+    fpath = str(tmp_path / 'conf.yaml')
+    myml.dump_yaml({'name': 'plant', 'layers': [{'id': 1, 'tags': ['a', 'b']}], 'limits': {'p_max': 5.5}}, fpath)
+    yield fpath
+    myml.clear_yaml_cache()
+
+
+def _no_parse (*args):
+    raise AssertionError('parsed again')
+
+
+def test_load_yaml_cache_returns_copies(fyaml, monkeypatch):
+    data = myml.load_yaml(fyaml, cache=True)
+    data['layers'][0]['tags'].append('c')
+    data['limits']['p_max'] = 0
+    monkeypatch.setattr(myml, '_parse_yaml', _no_parse)
+    again = myml.load_yaml(fyaml, cache=True)
+    assert again == myml.load_yaml(fyaml, cache=True) == {'name': 'plant', 'layers': [{'id': 1, 'tags': ['a', 'b']}], 
+                                                           'limits': {'p_max': 5.5}}
+    assert again is not myml.load_yaml(fyaml, cache=True)
+
+
+def test_load_yaml_cache_invalidated_by_changes(fyaml):
+    assert myml.load_yaml(fyaml, cache=True)['name'] == 'plant'
+    myml.dump_yaml({'name': 'other'}, fyaml)
+    assert myml.load_yaml(fyaml, cache=True) == {'name': 'other'}
+    # Same size, newer modification time
+    myml.dump_yaml({'name': 'otheR'}, fyaml)
+    st = os.stat(fyaml)
+    os.utime(fyaml, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert myml.load_yaml(fyaml, cache=True) == {'name': 'otheR'}
+
+
+def test_load_yaml_cache_per_loader(fyaml):
+    assert myml.load_yaml(fyaml, cache=True) == myml.load_yaml(fyaml, loader=myml.SAFE_LOADER, cache=True)
+    assert len(myml._cache) == 2
+
+
+def test_load_yaml_snapshot(fyaml, tmp_path, monkeypatch):
+    snap_dir = str(tmp_path / 'snap')
+    data     = myml.load_yaml(fyaml, snapshot_dir=snap_dir)
+    assert len(os.listdir(snap_dir)) == 1
+    # A new process (empty cache) loads the snapshot without parsing the file
+    myml.clear_yaml_cache()
+    with monkeypatch.context() as m:
+        m.setattr(myml, '_parse_yaml', _no_parse)
+        snap = myml.load_yaml(fyaml, snapshot_dir=snap_dir)
+        assert snap == data and snap is not data
+    # The snapshot is refreshed when the file changes
+    myml.dump_yaml({'name': 'new'}, fyaml)
+    assert myml.load_yaml(fyaml, snapshot_dir=snap_dir) == {'name': 'new'}
+    myml.clear_yaml_cache()
+    monkeypatch.setattr(myml, '_parse_yaml', _no_parse)
+    assert myml.load_yaml(fyaml, snapshot_dir=snap_dir) == {'name': 'new'}